@@ -1,7 +1,9 @@
-import re
-from urllib.parse import unquote
+import os
+from functools import lru_cache
+from urllib.parse import unquote, urlencode
 
 import dash
+import flask
 import dash_html_components as html
 import dash_core_components as dcc
 import dash_bootstrap_components as dbc
@@ -9,82 +11,93 @@ from dash.dependencies import Output, Input, State
 from dash.exceptions import PreventUpdate
 from dash_html_components.A import A
 from dash_table import DataTable
-import plotly.graph_objects as go
 import plotly.express as px
-import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.impute import SimpleImputer
+from threadpoolctl import threadpool_info
+
+from clustering import RESULTS_VERSION, kmeans_labels, kmeans_sweep, thread_budget
+from compression import enable_compression
+from data_loader import float64_values
+from dataset import DataStore, PovertyData, SERIES_COLUMNS, gini, indicator_columns, named
+from encoding import decoded_graph, encode_figure
+from export import MIMETYPES, STREAMS
+from figure_store import FigureStore
+from figures import (cluster_choropleth, cluster_sweep_chart, gini_country_bars, gini_heatmap,
+                     gini_year_bar, make_empty_fig, make_indicator_map, make_indicator_year_map,
+                     perc_pov_scatter, year_histogram)
+from footnotes import footnotes
+from jobs import DONE, FAILED, JOB_WORKERS, JobQueue, QueueFull
+from result_store import ResultStore
+from tables import filter_frame, page_records, sort_frame, sort_key
 
 
 app = dash.Dash(__name__, 
                 meta_tags=[{'name': 'viewport',
                             'content': 'width=device-width, initial-scale=1.0, maximum-scale=4, minimum-scale=0.5,'}],
-                external_stylesheets=[dbc.themes.COSMO])
+                external_stylesheets=[dbc.themes.COSMO],
+                compress=False)
+enable_compression(app)
 server = app.server 
-poverty_data = pd.read_csv('../data/PovStatsData.csv')
-poverty = pd.read_csv('../data/poverty.csv', low_memory=False)
-series = pd.read_csv('../data/PovStatsSeries.csv')
-
-gini = 'GINI index (World Bank estimate)'
-gini_df = poverty[poverty[gini].notna()]
-
-
-regions = ['East Asia & Pacific', 'Europe & Central Asia',
-           'Fragile and conflict affected situations', 'High income',
-           'IDA countries classified as fragile situations', 'IDA total',
-           'Latin America & Caribbean', 'Low & middle income', 'Low income',
-           'Lower middle income', 'Middle East & North Africa',
-           'Middle income', 'South Asia', 'Sub-Saharan Africa',
-           'Upper middle income', 'World']
-
-population_df = poverty_data[~poverty_data['Country Name'].isin(regions) &
-                             (poverty_data['Indicator Name']== 'Population, total')]
-
-income_share_df = poverty.filter(regex='Country Name|^year$|Income share.*?20').dropna()
-income_share_df = income_share_df.rename(columns={
-    'Income share held by lowest 20%': '1 Income share held by lowest 20%',
-    'Income share held by second 20%': '2 Income share held by second 20%',
-    'Income share held by third 20%': '3 Income share held by third 20%',
-    'Income share held by fourth 20%': '4 Income share held by fourth 20%',
-    'Income share held by highest 20%': '5 Income share held by highest 20%'
-}).sort_index(axis=1)
-
-income_share_df.columns = [re.sub('\d Income share held by ', '', col).title()
-                           for col in income_share_df.columns]
-income_share_cols = income_share_df.columns[:-2]
-
-perc_pov_cols = poverty.filter(regex='Poverty gap').columns
-perc_pov_df = poverty[poverty['is_country']].dropna(subset=perc_pov_cols)
-perc_pov_years = sorted(set(perc_pov_df['year']))
+APP_TABLES = {
+    'poverty': ['Country Name', 'Country Code', 'year', 'is_country'] + indicator_columns(),
+    'series': SERIES_COLUMNS + ['Series Code'],
+    'country_df': named,
+}
+store = DataStore(lambda: PovertyData.load(tables=APP_TABLES))
+data = store.current
+
+indicator_maps = FigureStore('indicator_map',
+                             lambda data, indicator: make_indicator_map(data.country_rows(), indicator))
+store.on_reload(lambda old, new: indicator_maps.drop_versions_except(new.version))
+# With POVERTY_LAZY_MAP=1 (the default) the indicator map shows one year at
+# a time and the year slider below it fetches the other years on demand,
+# instead of shipping all ~45 animation frames in the first response.
+LAZY_MAP_YEARS = os.environ.get('POVERTY_LAZY_MAP', '1') == '1'
+indicator_year_maps = FigureStore(
+    'indicator_year_map',
+    lambda data, key: make_indicator_year_map(
+        data.rows_for_years([key[1]]).dropna(subset=[key[0]]), key[0],
+        data.indicator_range[key[0]]))
+store.on_reload(lambda old, new: indicator_year_maps.drop_versions_except(new.version))
+if os.environ.get('POVERTY_WARM_FIGURES'):
+    if LAZY_MAP_YEARS:
+        indicator_year_maps.warm(data, [(indicator, data.indicator_years[indicator][-1])
+                                        for indicator in data.indicators])
+    else:
+        indicator_maps.warm(data, list(data.indicators))
 
-cividis0 = px.colors.sequential.Cividis[0]
+# Scatter and line charts with more points than this are drawn with WebGL
+# (scattergl) instead of an SVG element per point.
+WEBGL_POINTS = int(os.environ.get('POVERTY_WEBGL_POINTS', 1000))
 
-country_df = pd.read_csv('../data/PovStatsCountry.csv').drop(['Unnamed: 30'], axis=1)
-countries = poverty[poverty['is_country']]['Country Name'].drop_duplicates().sort_values().tolist()
 
-def make_empty_fig():
-    fig = go.Figure()
-    fig.layout.paper_bgcolor = '#E5ECF6'
-    fig.layout.plot_bgcolor = '#E5ECF6'
-    return fig
+def render_mode(n_points):
+    return 'webgl' if n_points > WEBGL_POINTS else 'svg'
 
 
-def multiline_indicator(indicator):
-    final = []
-    split = indicator.split()
-    for i in range(0, len(split), 3):
-        final.append(' '.join(split[i:i+3]))
-    return '<br>'.join(final)
+cividis0 = px.colors.sequential.Cividis[0]
 
+map_years = sorted(set(data.poverty['year']))
+map_year_controls = [
+    dbc.Row([
+        dbc.Col([
+            dbc.Button('Play', id='indicator_map_play_button', size='sm'),
+        ], width='auto'),
+        dbc.Col([
+            dcc.Slider(id='indicator_map_year_slider',
+                       min=map_years[0], max=map_years[-1], step=1, included=False,
+                       marks={year: str(year) for year in range(map_years[0], map_years[-1] + 1, 5)}),
+        ]),
+    ]),
+    dcc.Interval(id='indicator_map_play_interval', interval=1000, disabled=True),
+] if LAZY_MAP_YEARS else []
 
 main_layout = html.Div([
     html.Div([
     dbc.NavbarSimple([
         dbc.DropdownMenu([
             dbc.DropdownMenuItem(country, href=country)
-            for country in countries
+            for country in data.countries
             ], label='Select country'),
         ], brand='Home',brand_href='/'),
     dcc.Location(id='location'),
@@ -140,7 +153,7 @@ country_dashboard = html.Div([
                              placeholder='Choose an indicator',
                              value='Population, total',
                              options=[{'label': indicator, 'value': indicator}
-                                     for indicator in poverty.columns[3:54]]),                
+                                     for indicator in data.indicators]),                
             ], lg=6, md=11),
             dbc.Col([
                 dbc.Label('Select countries:'),
@@ -148,7 +161,7 @@ country_dashboard = html.Div([
                              placeholder='Select one or more countries to compare',
                              multi=True,
                              options=[{'label': c, 'value': c}
-                                       for c in countries]),
+                                       for c in data.countries]),
             ], lg=6, md=11)
         ]),
         html.Br(), html.Br(),
@@ -176,8 +189,9 @@ indicators_dashboard = html.Div([
                                  value='GINI index (World Bank estimate)',
                                  options=[{'label': indicator,
                                  'value': indicator} 
-                                 for indicator in poverty.columns[3:54]]),
-                    dcc.Graph(id='indicator_map_chart'),
+                                 for indicator in data.indicators]),
+                    decoded_graph(app, 'indicator_map_chart'),
+                    *map_year_controls,
                     dcc.Markdown(id='indicator_map_details_md',
                                 style={'backgroundColor': '#E5ECF6'})
                 ], label='Explore Metrics'),
@@ -210,16 +224,26 @@ indicators_dashboard = html.Div([
                                         multi=True,
                                         value=['Population, total'],
                                         options=[{'label': indicator, 'value': indicator}
-                                                for indicator in poverty.columns[3:54]]),
+                                                for indicator in data.indicators]),
                         ], lg=6),
                         dbc.Col([            
                             dbc.Label(''),html.Br(),
                             dbc.Button("Submit", id='clustering_submit_button'),
+                            ' ',
+                            dbc.Button('Compare 2-15 clusters', id='cluster_sweep_button',
+                                       color='secondary'),
                         ]),
                     ]),
+                    html.Div(id='clustering_status'),
+                    dcc.Store(id='clustering_job'),
+                    dcc.Interval(id='clustering_poll', interval=1000, disabled=True),
                     dcc.Loading([
                         dcc.Graph(id='clustered_map_chart')
-                    ])
+                    ]),
+                    html.Div(id='cluster_sweep_status'),
+                    dcc.Store(id='cluster_sweep_job'),
+                    dcc.Interval(id='cluster_sweep_poll', interval=1000, disabled=True),
+                    dcc.Graph(id='cluster_sweep_chart', figure=make_empty_fig()),
                 ], label='Cluster Countries'),
             ]),
         ], lg=8)
@@ -234,7 +258,7 @@ indicators_dashboard = html.Div([
             dcc.Dropdown(id='hist_indicator_dropdown',optionHeight=40,
                          value='GINI index (World Bank estimate)',
                          options=[{'label': indicator, 'value': indicator}
-                                  for indicator in poverty.columns[3:54]]),
+                                  for indicator in data.indicators]),
         ], lg=5),
         dbc.Col([
             dbc.Label('Years:'),
@@ -243,7 +267,7 @@ indicators_dashboard = html.Div([
                          value=[2015],
                          placeholder='Select one or more years',
                          options=[{'label': year, 'value': year}
-                                  for year in poverty['year'].drop_duplicates().sort_values()]),
+                                  for year in data.poverty['year'].drop_duplicates().sort_values()]),
         ], lg=3),
     ]),
     html.Br(),
@@ -255,7 +279,7 @@ indicators_dashboard = html.Div([
             dcc.Slider(id='hist_bins_slider', 
                        dots=True, min=0, max=100, step=5, included=False,
                        marks={x: str(x) for x in range(0, 105, 5)}),
-            dcc.Graph(id='indicator_year_histogram',figure=make_empty_fig()),                       
+            decoded_graph(app, 'indicator_year_histogram', figure=make_empty_fig()),                       
         ], lg=8)
         
     ]),
@@ -276,8 +300,7 @@ indicators_dashboard = html.Div([
             dbc.Label('Year'),
             dcc.Dropdown(id='gini_year_dropdown',
                          placeholder='Select a year',
-                         options=[{'label': year, 'value': year}
-                                  for year in gini_df['year'].drop_duplicates().sort_values()]),
+                         options=[{'label': year, 'value': year} for year in data.gini_years]),
             html.Br(),
             dcc.Graph(id='gini_year_barchart',
                       figure=make_empty_fig())
@@ -288,7 +311,7 @@ indicators_dashboard = html.Div([
                          placeholder='Select one or more countries',
                          multi=True,
                          options=[{'label': country, 'value': country}
-                                  for country in gini_df['Country Name'].unique()]),
+                                  for country in data.gini_countries]),
             html.Br(),
             dcc.Graph(id='gini_country_barchart',
                       figure=make_empty_fig())
@@ -304,7 +327,7 @@ indicators_dashboard = html.Div([
             dcc.Dropdown(id='income_share_country_dropdown', 
                          placeholder='Select a country',
                          options=[{'label': country, 'value': country}
-                                  for country in income_share_df['Country Name'].unique()]),
+                                  for country in data.income_share_df['Country Name'].unique()]),
             dcc.Graph(id='income_share_country_barchart',
                      figure=make_empty_fig())
         ], lg=8)
@@ -332,21 +355,21 @@ indicators_dashboard = html.Div([
     dbc.Col([
         dbc.Label('Select year:'),
         dcc.Slider(id='perc_pov_year_slider',
-                   min=perc_pov_years[0], 
-                   max=perc_pov_years[-1],
+                   min=data.perc_pov_years[0], 
+                   max=data.perc_pov_years[-1],
                    step=1,
                    included=False,
                    value=2018,
                    marks={year: {'label': str(year), 
                                  'style': {'color': cividis0, 'fontSize': 14}} 
-                          for year in perc_pov_years[::5]}),
+                          for year in data.perc_pov_years[::5]}),
         ], lg=5),
   ]),
     dbc.Row([
         dbc.Col(lg=1),
         dbc.Col([
-            dcc.Graph(id='perc_pov_scatter_chart',
-                      figure=make_empty_fig())
+            decoded_graph(app, 'perc_pov_scatter_chart',
+                          figure=make_empty_fig())
         ], lg=10)
     ]),
 ], style={'backgroundColor': '#E5ECF6'})
@@ -355,6 +378,9 @@ app.validation_layout = html.Div([
     main_layout,
     indicators_dashboard,
     country_dashboard,
+    DataTable(id='histogram_table'),
+    A(id='histogram_csv_link'),
+    A(id='histogram_parquet_link'),
 ])
 
 app.layout = main_layout
@@ -362,57 +388,69 @@ app.layout = main_layout
 @app.callback(Output('main_content', 'children'),
               Input('location', 'pathname'))
 def display_content(pathname):
-    if unquote(pathname[1:]) in countries:
+    if unquote(pathname[1:]) in store.current.countries:
         return country_dashboard
     else:
         return indicators_dashboard
 
-@app.callback(Output('indicator_map_chart', 'figure'),
-              Output('indicator_map_details_md', 'children'),
+@app.callback(Output('indicator_map_details_md', 'children'),
               Input('indicator_dropdown', 'value'))
-def display_generic_map_chart(indicator):
+def display_indicator_details(indicator):
     if indicator is None:
         raise PreventUpdate
-    df = poverty[poverty['is_country']]
-    fig = px.choropleth(df, locations='Country Code', 
-                        color=indicator,
-                        title=indicator,
-                        hover_name='Country Name',
-                        color_continuous_scale='cividis',
-                        animation_frame='year', height=650)
-    fig.layout.geo.showframe = False
-    fig.layout.geo.showcountries = True
-    fig.layout.geo.projection.type = 'natural earth'
-    fig.layout.geo.lataxis.range = [-53, 76]
-    fig.layout.geo.lonaxis.range = [-138, 167]
-    fig.layout.geo.landcolor = 'white'
-    fig.layout.geo.bgcolor = '#E5ECF6'
-    fig.layout.paper_bgcolor = '#E5ECF6'
-    fig.layout.geo.countrycolor = 'gray'
-    fig.layout.geo.coastlinecolor = 'gray'
-    fig.layout.coloraxis.colorbar.title = multiline_indicator(indicator)
-    
-    series_df = series[series['Indicator Name'].eq(indicator)]
-    if series_df.empty:
-        markdown = "No details available on this indicator"
-    else:
-        limitations = series_df['Limitations and exceptions'].fillna('N/A').str.replace('\n\n', ' ').values[0]
-
-        markdown = f"""
-        ## {series_df['Indicator Name'].values[0]}  
-        
-        {series_df['Long definition'].values[0]}  
-        
-        * **Unit of measure** {series_df['Unit of measure'].fillna('count').values[0]}
-        * **Periodicity** {series_df['Periodicity'].fillna('N/A').values[0]}
-        * **Source** {series_df['Source'].values[0]}
-        
-        ### Limitations and exceptions:  
-        
-        {limitations}  
-
-        """
-    return fig, markdown
+    return store.current.indicator_markdown.get(indicator, 'No details available on this indicator')
+
+
+if LAZY_MAP_YEARS:
+    @app.callback(Output('indicator_map_chart_encoded', 'data'),
+                  Input('indicator_dropdown', 'value'),
+                  Input('indicator_map_year_slider', 'value'))
+    def display_generic_map_chart(indicator, year):
+        if indicator is None or year is None:
+            raise PreventUpdate
+        data = store.current
+        years = data.indicator_years[indicator]
+        fig = indicator_year_maps.get(data, (indicator, year))
+        # Render the neighbouring years while the user looks at this one.
+        if year in years:
+            i = years.index(year)
+            indicator_year_maps.prefetch(data, [(indicator, y) for y in years[max(i - 1, 0):i + 2]])
+        return encode_figure(fig)
+
+
+    @app.callback(Output('indicator_map_year_slider', 'value'),
+                  Input('indicator_dropdown', 'value'),
+                  Input('indicator_map_play_interval', 'n_intervals'),
+                  State('indicator_map_year_slider', 'value'))
+    def set_map_year(indicator, n_intervals, year):
+        if indicator is None:
+            raise PreventUpdate
+        years = store.current.indicator_years[indicator]
+        if not years:
+            raise PreventUpdate
+        trigger = dash.callback_context.triggered[0]['prop_id']
+        if trigger != 'indicator_map_play_interval.n_intervals' or year is None:
+            return years[-1]
+        later = [y for y in years if y > year]
+        return later[0] if later else years[0]
+
+
+    @app.callback(Output('indicator_map_play_interval', 'disabled'),
+                  Output('indicator_map_play_button', 'children'),
+                  Input('indicator_map_play_button', 'n_clicks'),
+                  State('indicator_map_play_interval', 'disabled'))
+    def toggle_map_animation(n_clicks, disabled):
+        if not n_clicks:
+            raise PreventUpdate
+        return not disabled, 'Play' if not disabled else 'Pause'
+
+else:
+    @app.callback(Output('indicator_map_chart_encoded', 'data'),
+                  Input('indicator_dropdown', 'value'))
+    def display_generic_map_chart(indicator):
+        if indicator is None:
+            raise PreventUpdate
+        return encode_figure(indicator_maps.get(store.current, indicator))
 
 
 @app.callback(Output('gini_year_barchart', 'figure'),
@@ -420,16 +458,16 @@ def display_generic_map_chart(indicator):
 def plot_gini_year_barchart(year):
     if not year:
         raise PreventUpdate
-    df = gini_df[gini_df['year'].eq(year)].sort_values(gini).dropna(subset=[gini])
-    n_countries = len(df['Country Name'])
-    fig = px.bar(df,
-                 x=gini,
-                 y='Country Name', 
-                 orientation='h',
-                 height=200 + (n_countries*20), 
-                 title=gini + ' ' + str(year))
-    fig.layout.paper_bgcolor = '#E5ECF6'                 
-    return fig
+    values, countries = store.current.gini_by_year.get(year, ((), []))
+    return gini_year_bar(values, countries, gini,
+                         title=gini + ' ' + str(year),
+                         height=200 + (len(countries) * 20))
+
+
+# Above this many countries the chart is one heatmap row per country
+# instead of a facet (a subplot with its own axes) per country, so its size
+# grows with the number of values rather than of subplots.
+GINI_MAX_FACETS = int(os.environ.get('POVERTY_GINI_MAX_FACETS', 6))
 
 
 @app.callback(Output('gini_country_barchart', 'figure'),
@@ -437,17 +475,19 @@ def plot_gini_year_barchart(year):
 def plot_gini_country_barchart(countries):
     if not countries:
         raise PreventUpdate
-    df = gini_df[gini_df['Country Name'].isin(countries)].dropna(subset=[gini])
-    fig = px.bar(df,
-                 x='year',
-                 y=gini,
-                 height=100 + (250*len(countries)),
-                 facet_row='Country Name',
-                 color='Country Name',
-                 labels={gini: 'Gini Index'},
-                 title=''.join([gini, '<br><b>', ', '.join(countries), '</b>']))
-    fig.layout.paper_bgcolor = '#E5ECF6'                 
-    return fig
+    data = store.current
+    if len(countries) > GINI_MAX_FACETS:
+        values, rows, years = data.gini_table(countries)
+        return gini_heatmap(values, rows, years, 'Gini Index',
+                            title=f'{gini}<br><b>{len(rows)} countries</b>',
+                            height=200 + (20*len(rows)))
+    # Facets in table order, like px.bar(facet_row=...) on the filtered rows.
+    selected = set(countries)
+    series = [(country,) + data.gini_by_country[country]
+              for country in data.gini_countries if country in selected]
+    return gini_country_bars(series, 'Gini Index',
+                             title=''.join([gini, '<br><b>', ', '.join(countries), '</b>']),
+                             height=100 + (250*len(countries)))
 
 
 @app.callback(Output('income_share_country_barchart', 'figure'),
@@ -455,8 +495,10 @@ def plot_gini_country_barchart(countries):
 def plot_income_share_barchart(country):
     if country is None:
         raise PreventUpdate
+    data = store.current
+    income_share_df = data.income_share_df
     fig = px.bar(income_share_df[income_share_df['Country Name']==country].dropna(), 
-                 x=income_share_cols,
+                 x=data.income_share_cols,
                  y='Year',
                  barmode='stack',
                  height=600, 
@@ -473,11 +515,13 @@ def plot_income_share_barchart(country):
     return fig
 
 
-@app.callback(Output('perc_pov_scatter_chart', 'figure'),
+@app.callback(Output('perc_pov_scatter_chart_encoded', 'data'),
               Input('perc_pov_year_slider', 'value'),
               Input('perc_pov_indicator_slider', 'value'))
 def plot_perc_pov_chart(year, indicator):
-    indicator = perc_pov_cols[indicator]
+    data = store.current
+    indicator = data.perc_pov_cols[indicator]
+    perc_pov_df = data.perc_pov_df
     df = (perc_pov_df
           [perc_pov_df['year'].eq(year)]
           .dropna(subset=[indicator])
@@ -485,22 +529,36 @@ def plot_perc_pov_chart(year, indicator):
     if df.empty:
         raise PreventUpdate
 
-    fig = px.scatter(df,
-                     x=indicator, 
-                     y='Country Name',
-                     color='Population, total', 
-                     size=[30]*len(df),
-                     size_max=15,
-                     hover_name='Country Name',
-                     height=250 +(20*len(df)),
-                     color_continuous_scale='cividis',
-                     title=indicator + '<b>: ' + f'{year}' +'</b>')
-    fig.layout.paper_bgcolor = '#E5ECF6'
-    fig.layout.xaxis.ticksuffix = '%'
-    return fig
+    fig = perc_pov_scatter(float64_values(df[indicator]), df['Country Name'].tolist(),
+                           float64_values(df['Population, total']), indicator,
+                           title=indicator + '<b>: ' + f'{year}' +'</b>',
+                           height=250 + (20 * len(df)), render_mode=render_mode(len(df)))
+    return encode_figure(fig)
+
+
+# The histogram is drawn from bin counts computed here rather than from
+# the raw values, over edges shared by all the years of an indicator so
+# that each year's counts can be cached on their own. The table below it
+# is filtered, sorted and paged on the server, and only the visible page
+# is sent to the browser.
+HISTOGRAM_PAGE_SIZE = 50
+
+
+@lru_cache(maxsize=256)
+def histogram_edges(data, indicator, nbins):
+    values = data.country_rows()[indicator].dropna().to_numpy()
+    return np.histogram_bin_edges(values, bins=nbins or 'auto')
 
 
-@app.callback(Output('indicator_year_histogram', 'figure'),
+@lru_cache(maxsize=4096)
+def histogram_counts(data, indicator, year, nbins):
+    values = data.rows_for_years([year])[indicator].dropna().to_numpy()
+    return np.histogram(values, bins=histogram_edges(data, indicator, nbins))[0]
+
+store.on_reload(lambda old, new: (histogram_edges.cache_clear(), histogram_counts.cache_clear()))
+
+
+@app.callback(Output('indicator_year_histogram_encoded', 'data'),
               Output('table_histogram_output', 'children'),
               Input('hist_multi_year_selector', 'value'),
               Input('hist_indicator_dropdown', 'value'),
@@ -508,80 +566,232 @@ def plot_perc_pov_chart(year, indicator):
 def display_histogram(years, indicator, nbins):
     if (not years) or (not indicator):
         raise PreventUpdate
-    df = poverty[poverty['year'].isin(years) & poverty['is_country']]
-    fig = px.histogram(df, x=indicator, facet_col='year', color='year', 
-                       title=indicator + ' Histogram',
-                       nbins=nbins,
-                       facet_col_wrap=4, height=700)
-    fig.for_each_xaxis(lambda axis: axis.update(title=''))
-    fig.add_annotation(text=indicator, x=0.5, y=-0.12, xref='paper',
-                       yref='paper', showarrow=False)
-    fig.layout.paper_bgcolor = '#E5ECF6'
-
-    table = DataTable(columns = [{'name': col, 'id': col} 
-                                 for col in df[['Country Name', 'year', indicator]].columns],
-                      data = df[['Country Name', 'year', indicator]].to_dict('records'),
+    data = store.current
+    edges = histogram_edges(data, indicator, nbins)
+    counts = {year: histogram_counts(data, indicator, year, nbins) for year in years}
+    fig = year_histogram(counts, edges, indicator)
+
+    table = DataTable(id='histogram_table',
+                      columns=[{'name': 'Country Name', 'id': 'Country Name', 'type': 'text'},
+                               {'name': 'year', 'id': 'year', 'type': 'numeric'},
+                               {'name': indicator, 'id': indicator, 'type': 'numeric'}],
                       style_header={'whiteSpace': 'normal'},
                       fixed_rows={'headers': True},
-                      virtualization=True,
                       style_table={'height': '400px'},
-                      sort_action='native',
-                      filter_action='native',
-                      export_format='csv',
-                      style_cell={'minWidth': '150px'}),
-    return fig, table
+                      page_action='custom',
+                      page_current=0,
+                      page_size=HISTOGRAM_PAGE_SIZE,
+                      sort_action='custom',
+                      sort_by=[],
+                      filter_action='custom',
+                      filter_query='',
+                      style_cell={'minWidth': '150px'})
+    links = html.Div([A('Download CSV', id='histogram_csv_link'), ' | ',
+                      A('Download Parquet', id='histogram_parquet_link')])
+    return encode_figure(fig), [links, table]
+
+
+@lru_cache(maxsize=16)
+def histogram_table_rows(data, years, indicator, filter_query, key):
+    df = data.rows_for_years(years)[['Country Name', 'year', indicator]]
+    return sort_frame(filter_frame(df, filter_query), key)
+
+store.on_reload(lambda old, new: histogram_table_rows.cache_clear())
+
+
+@app.callback(Output('histogram_table', 'data'),
+              Output('histogram_table', 'page_count'),
+              Input('histogram_table', 'page_current'),
+              Input('histogram_table', 'page_size'),
+              Input('histogram_table', 'sort_by'),
+              Input('histogram_table', 'filter_query'),
+              State('hist_multi_year_selector', 'value'),
+              State('hist_indicator_dropdown', 'value'))
+def display_histogram_table_page(page_current, page_size, sort_by, filter_query, years, indicator):
+    if (not years) or (not indicator):
+        raise PreventUpdate
+    df = histogram_table_rows(store.current, tuple(years), indicator,
+                              filter_query or '', sort_key(sort_by))
+    return page_records(df, page_current, page_size)
+
+
+@app.callback(Output('histogram_csv_link', 'href'),
+              Output('histogram_parquet_link', 'href'),
+              Input('histogram_table', 'filter_query'),
+              State('hist_multi_year_selector', 'value'),
+              State('hist_indicator_dropdown', 'value'))
+def set_histogram_export_links(filter_query, years, indicator):
+    if (not years) or (not indicator):
+        raise PreventUpdate
+    query = urlencode([('indicator', indicator), ('filter', filter_query or '')] +
+                      [('year', year) for year in years])
+    return [app.get_relative_path(f'/export/histogram.{fmt}') + '?' + query
+            for fmt in ['csv', 'parquet']]
+
+
+@server.route('/export/histogram.<fmt>')
+def export_histogram(fmt):
+    """The histogram table's rows for ?indicator=&year=&filter=, streamed."""
+    args = flask.request.args
+    data = store.current
+    indicator = args.get('indicator')
+    years = tuple(args.getlist('year', type=int))
+    if fmt not in STREAMS or indicator not in data.indicators or not years:
+        flask.abort(404)
+    df = histogram_table_rows(data, years, indicator, args.get('filter', ''), ())
+    try:
+        chunks = STREAMS[fmt](df)
+        first = next(chunks)
+    except RuntimeError as e:
+        flask.abort(501, str(e))
+
+    def generate():
+        yield first
+        yield from chunks
+
+    return flask.Response(generate(), mimetype=MIMETYPES[fmt], headers={
+        'Content-Disposition': f'attachment; filename=histogram.{fmt}'})
+
+
+# KMeans labels and inertia per (year, number of clusters, sorted
+# indicators), computed once per data version. Submit queues the fit as a
+# background job and the clustering_poll interval checks on it, so a slow
+# fit never holds up a request. Each fit gets FIT_THREADS native
+# (OpenMP/BLAS) threads, shared out between all the fits that can run on
+# the host at once; see /status/threads.
+SWEEP_WORKERS = 1
+FIT_THREADS = thread_budget(JOB_WORKERS + SWEEP_WORKERS)
+
+clusters = ResultStore('kmeans', RESULTS_VERSION)
+cluster_jobs = JobQueue(clusters, threads=FIT_THREADS)
+store.on_reload(lambda old, new: (clusters.drop_versions_except(new.version),
+                                  cluster_jobs.drop_versions_except(new.version)))
+
+# The sweep fits every number of clusters on the slider in one job, and
+# its labels fill the cache above, so Submit is instant for any of them.
+sweeps = ResultStore('kmeans_sweep', RESULTS_VERSION)
+sweep_jobs = JobQueue(sweeps, max_workers=SWEEP_WORKERS, threads=FIT_THREADS)
+store.on_reload(lambda old, new: (sweeps.drop_versions_except(new.version),
+                                  sweep_jobs.drop_versions_except(new.version)))
+
+
+# The thread budget of a fit, the pools the last fits run from this worker
+# saw, and this web process's own pools, which the budget does not limit.
+@server.route('/status/threads')
+def thread_status():
+    return flask.jsonify(pid=os.getpid(), threads_per_fit=FIT_THREADS,
+                         fit_thread_pools={jobs.results.name: jobs.last_thread_pools
+                                           for jobs in (cluster_jobs, sweep_jobs)},
+                         thread_pools=threadpool_info())
+
+
+def poll_job(jobs, job):
+    """None once ``job`` is done, else the (job, poll disabled, status) to show."""
+    status = jobs.status(job['id']) or {'state': FAILED, 'error': 'unknown job'}
+    if status['state'] == FAILED:
+        return None, True, f"Clustering failed: {status['error']}"
+    if status['state'] != DONE:
+        return dash.no_update, False, f"Clustering... ({status['state']})"
+    return None
 
 
 @app.callback(Output('clustered_map_chart', 'figure'),
+              Output('clustering_job', 'data'),
+              Output('clustering_poll', 'disabled'),
+              Output('clustering_status', 'children'),
               Input('clustering_submit_button', 'n_clicks'),
+              Input('clustering_poll', 'n_intervals'),
+              State('clustering_job', 'data'),
               State('year_cluster_slider', 'value'),
               State('ncluster_cluster_slider', 'value'),
               State('cluster_indicator_dropdown', 'value'))
-def clustered_map(n_clicks, year, n_clusters, indicators):
+def clustered_map(n_clicks, n_intervals, job, year, n_clusters, indicators):
+    triggered = dash.callback_context.triggered[0]['prop_id']
+    if triggered == 'clustering_poll.n_intervals':
+        if not job:
+            raise PreventUpdate
+        pending = poll_job(cluster_jobs, job)
+        if pending is not None:
+            return (dash.no_update, *pending)
+        year, n_clusters, indicators = job['year'], job['n_clusters'], job['indicators']
     if not indicators:
         raise PreventUpdate
-    imp = SimpleImputer(missing_values=np.nan, strategy='mean')
-    scaler = StandardScaler()
-    kmeans = KMeans(n_clusters=n_clusters)
-    
-    df = poverty[poverty['is_country'] & poverty['year'].eq(year)][indicators + ['Country Name', 'year']]
-    data = df[indicators]
+    data = store.current
+    df = data.rows_for_years([year])[indicators + ['Country Name', 'year']]
     if df.isna().all().any():
-        return px.scatter(title='No available data for the selected combination of year/indicators.')
-    data_no_na = imp.fit_transform(data)
-    scaled_data = scaler.fit_transform(data_no_na)
-    kmeans.fit(scaled_data)
-
-    fig = px.choropleth(df,
-                        locations='Country Name',
-                        locationmode='country names',
-                        color=[str(x) for x in  kmeans.labels_], 
-                        labels={'color': 'Cluster'},
-                        hover_data=indicators,
-                        height=650,
-                        title=f'Country clusters - {year}. Number of clusters: {n_clusters}<br>Inertia: {kmeans.inertia_:,.2f}',
-                        color_discrete_sequence=px.colors.qualitative.T10)
-    fig.add_annotation(x=-0.1, y=-0.15, 
-                       xref='paper', yref='paper',
-                       text='Indicators:<br>' + "<br>".join(indicators), 
-                       showarrow=False)
-    fig.layout.geo.showframe = False
-    fig.layout.geo.showcountries = True
-    fig.layout.geo.projection.type = 'natural earth'
-    fig.layout.geo.lataxis.range = [-53, 76]
-    fig.layout.geo.lonaxis.range = [-137, 168]
-    fig.layout.geo.landcolor = 'white'
-    fig.layout.geo.bgcolor = '#E5ECF6'
-    fig.layout.paper_bgcolor = '#E5ECF6'
-    fig.layout.geo.countrycolor = 'gray'
-    fig.layout.geo.coastlinecolor = 'gray'
-    return fig
+        return px.scatter(title='No available data for the selected combination of year/indicators.'), None, True, ''
+    key = (year, n_clusters, sorted(indicators))
+    result = clusters.load(data, key)
+    if result is None:
+        try:
+            job_id = cluster_jobs.submit(data, key, kmeans_labels,
+                                         data.cluster_features(year, key[2]), n_clusters)
+        except QueueFull:
+            return dash.no_update, None, True, 'Too many clustering jobs are waiting, please try again shortly.'
+        job = {'id': job_id, 'year': year, 'n_clusters': n_clusters, 'indicators': indicators}
+        return dash.no_update, job, False, 'Clustering... (queued)'
+
+    return (cluster_choropleth(df['Country Name'].tolist(), result['labels'],
+                               float64_values(df[indicators].to_numpy()), indicators,
+                               title=f'Country clusters - {year}. Number of clusters: {n_clusters}<br>Inertia: {float(result["inertia"]):,.2f}'),
+            None, True, '')
+
+
+@app.callback(Output('cluster_sweep_chart', 'figure'),
+              Output('cluster_sweep_job', 'data'),
+              Output('cluster_sweep_poll', 'disabled'),
+              Output('cluster_sweep_status', 'children'),
+              Input('cluster_sweep_button', 'n_clicks'),
+              Input('cluster_sweep_poll', 'n_intervals'),
+              State('cluster_sweep_job', 'data'),
+              State('year_cluster_slider', 'value'),
+              State('cluster_indicator_dropdown', 'value'))
+def cluster_sweep(n_clicks, n_intervals, job, year, indicators):
+    triggered = dash.callback_context.triggered[0]['prop_id']
+    if triggered == 'cluster_sweep_poll.n_intervals':
+        if not job:
+            raise PreventUpdate
+        pending = poll_job(sweep_jobs, job)
+        if pending is not None:
+            return (dash.no_update, *pending)
+        year, indicators = job['year'], job['indicators']
+    elif not n_clicks:
+        raise PreventUpdate
+    if not indicators:
+        raise PreventUpdate
+    data = store.current
+    indicators = sorted(indicators)
+    if data.rows_for_years([year])[indicators].isna().all().any():
+        return dash.no_update, None, True, 'No available data for the selected combination of year/indicators.'
+    key = (year, indicators)
+    result = sweeps.load(data, key)
+    if result is None:
+        try:
+            job_id = sweep_jobs.submit(data, key, kmeans_sweep, data.cluster_features(year, indicators))
+        except QueueFull:
+            return dash.no_update, None, True, 'Too many clustering jobs are waiting, please try again shortly.'
+        return dash.no_update, {'id': job_id, 'year': year, 'indicators': indicators}, False, 'Clustering... (queued)'
+
+    for k, labels, inertia in zip(result['ks'].tolist(), result['labels'], result['inertia']):
+        if clusters.load(data, (year, k, indicators)) is None:
+            clusters.save(data, (year, k, indicators), {'labels': labels, 'inertia': inertia})
+    return (cluster_sweep_chart(result['ks'], result['inertia'], result['silhouette'],
+                                title=f'Inertia and silhouette score by number of clusters - {year}'),
+            None, True, 'Click a point to select that number of clusters.')
+
+
+@app.callback(Output('ncluster_cluster_slider', 'value'),
+              Input('cluster_sweep_chart', 'clickData'))
+def select_sweep_clusters(click_data):
+    if not click_data:
+        raise PreventUpdate
+    return click_data['points'][0]['x']
 
 
 @app.callback(Output('country_page_contry_dropdown', 'value'),
               Input('location', 'pathname'))
 def set_dropdown_values(pathname):
-    if unquote(pathname[1:]) in countries:
+    if unquote(pathname[1:]) in store.current.countries:
         country = unquote(pathname[1:])
         return [country]
 
@@ -597,14 +807,24 @@ def plot_country_charts(pathname, countries, indicator):
         raise PreventUpdate
     if unquote(pathname[1:]) in countries:
         country = unquote(pathname[1:])
-    df = poverty[poverty['is_country'] & poverty['Country Name'].isin(countries)]
+    data = store.current
+    df = data.rows_for_countries(countries)
+    hover_data = None
+    series_code = data.indicator_info.get(indicator, {}).get('Series Code')
+    if series_code:
+        notes = footnotes.lookup(df['Country Code'], series_code, df['year'])
+        if any(notes):
+            df = df.assign(Footnote=notes)
+            hover_data = ['Footnote']
     fig = px.line(df,
                   x='year',
                   y=indicator,
                   title='<b>' + indicator + '</b><br>' + ', '.join(countries),
-                  color='Country Name')
+                  color='Country Name',
+                  hover_data=hover_data,
+                  render_mode=render_mode(len(df)))
     fig.layout.paper_bgcolor = '#E5ECF6'
-    table = country_df[country_df['Short Name'] == countries[0]].T.reset_index()
+    table = data.country_df[data.country_df['Short Name'] == countries[0]].T.reset_index()
     if table.shape[1] == 2:
         table.columns = [countries[0] + ' Info', '']
         table = dbc.Table.from_dataframe(table)
@@ -614,4 +834,5 @@ def plot_country_charts(pathname, countries, indicator):
 
 
 if __name__ == '__main__':
+    store.start_watcher()
     app.run_server(debug=False)
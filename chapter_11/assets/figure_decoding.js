@@ -0,0 +1,49 @@
+// Decodes the {dtype, bdata} arrays written by encoding.py into typed arrays.
+(function () {
+    var TYPES = {
+        i1: Int8Array, i2: Int16Array, i4: Int32Array,
+        u1: Uint8Array, u2: Uint16Array, u4: Uint32Array,
+        f4: Float32Array, f8: Float64Array
+    };
+
+    function decodeArray(spec) {
+        var binary = window.atob(spec.bdata);
+        var bytes = new Uint8Array(binary.length);
+        for (var i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        return new TYPES[spec.dtype](bytes.buffer);
+    }
+
+    function decode(value) {
+        if (Array.isArray(value)) {
+            return value.map(decode);
+        }
+        if (value && typeof value === 'object') {
+            if (typeof value.bdata === 'string' && TYPES[value.dtype]) {
+                return decodeArray(value);
+            }
+            var out = {};
+            Object.keys(value).forEach(function (key) {
+                out[key] = decode(value[key]);
+            });
+            return out;
+        }
+        return value;
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        figures: {
+            decode: function (figure) {
+                if (!figure) {
+                    return window.dash_clientside.no_update;
+                }
+                return {
+                    data: decode(figure.data || []),
+                    layout: figure.layout,
+                    frames: figure.frames ? decode(figure.frames) : undefined
+                };
+            }
+        }
+    });
+})();
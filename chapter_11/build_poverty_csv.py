@@ -0,0 +1,114 @@
+"""Build data/poverty.csv from the raw World Bank PovStats files.
+
+PovStatsData.csv has one row per (country, indicator) with the years as
+wide columns. The output has one row per (country, year) with the
+indicators as columns, followed by the PovStatsCountry.csv metadata and
+an ``is_country`` flag (False for regions and income groups).
+
+The data file is streamed in chunks and written one country at a time,
+so memory is bounded by the largest country block rather than by the
+size of the extract. This relies on the rows of each country being
+contiguous, which is how the World Bank exports are laid out.
+
+    python build_poverty_csv.py [--output ../data/poverty.csv]
+"""
+import argparse
+import os
+import re
+
+import pandas as pd
+
+from data_loader import DATA_DIR
+
+
+ID_VARS = ['Country Name', 'Country Code', 'Indicator Name']
+INDEX = ['Country Code', 'Country Name', 'year']
+
+
+def is_year(column):
+    return re.fullmatch(r'\d{4}', column) is not None
+
+
+def read_data_chunks(path, chunksize):
+    return pd.read_csv(path, chunksize=chunksize,
+                       usecols=lambda col: col in ID_VARS or is_year(col))
+
+
+def find_indicators(path, chunksize):
+    indicators = set()
+    for chunk in read_data_chunks(path, chunksize):
+        year_cols = [col for col in chunk.columns if is_year(col)]
+        has_data = chunk[year_cols].notna().any(axis=1)
+        indicators.update(chunk.loc[has_data, 'Indicator Name'])
+    return sorted(indicators)
+
+
+def read_countries(path):
+    country = pd.read_csv(path, na_values='', keep_default_na=False)
+    country = country.drop(columns=[col for col in country.columns
+                                    if col.startswith('Unnamed')])
+    country['is_country'] = country['Region'].notna()
+    return country
+
+
+def iter_country_blocks(path, chunksize):
+    seen = set()
+    pending = None
+    for chunk in read_data_chunks(path, chunksize):
+        if pending is not None:
+            chunk = pd.concat([pending, chunk], ignore_index=True)
+        codes = chunk['Country Code']
+        last_code = codes.iloc[-1]
+        for code, block in chunk[codes.ne(last_code)].groupby('Country Code', sort=False):
+            if code in seen:
+                raise ValueError(f'Rows for {code} are not contiguous in {path}')
+            seen.add(code)
+            yield block
+        pending = chunk[codes.eq(last_code)]
+    if pending is not None and not pending.empty:
+        yield pending
+
+
+def reshape_block(block, indicators):
+    long = (block
+            .melt(id_vars=ID_VARS, var_name='year')
+            .dropna(subset=['value']))
+    long['year'] = long['year'].astype(int)
+    wide = (long
+            .pivot(index=INDEX, columns='Indicator Name', values='value')
+            .reindex(columns=indicators)
+            .reset_index())
+    wide.columns.name = None
+    return wide
+
+
+def build_poverty(data_path, country_path, output_path, chunksize=5000):
+    indicators = find_indicators(data_path, chunksize)
+    country = read_countries(country_path)
+    tmp_path = output_path + '.tmp'
+    rows = 0
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        header = True
+        for block in iter_country_blocks(data_path, chunksize):
+            wide = reshape_block(block, indicators)
+            if wide.empty:
+                continue
+            wide = wide.merge(country, on='Country Code', how='left')
+            wide['is_country'] = wide['is_country'].fillna(False).astype(bool)
+            wide.to_csv(f, header=header, index=False)
+            header = False
+            rows += len(wide)
+    os.replace(tmp_path, output_path)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default=os.path.join(DATA_DIR, 'PovStatsData.csv'))
+    parser.add_argument('--countries', default=os.path.join(DATA_DIR, 'PovStatsCountry.csv'))
+    parser.add_argument('--output', default=os.path.join(DATA_DIR, 'poverty.csv'))
+    parser.add_argument('--chunksize', type=int, default=5000,
+                        help='Rows of the data file to read at a time')
+    args = parser.parse_args()
+    rows = build_poverty(args.data, args.countries, args.output, args.chunksize)
+    print(f'Wrote {rows} rows to {args.output}')
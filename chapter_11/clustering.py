@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import sklearn
+from sklearn.cluster import KMeans
+from sklearn.metrics import silhouette_score
+
+
+SWEEP_CLUSTERS = range(2, 16)
+
+# Part of the path of the results kept on disk and of the job ids: change
+# it whenever the fits here change what they compute.
+CLUSTERING_VERSION = '1'
+RESULTS_VERSION = f'{CLUSTERING_VERSION}-sklearn{sklearn.__version__}'
+
+
+def thread_budget(concurrent_fits):
+    """OpenMP/BLAS threads per fit, so that all the fits on the host share its cores.
+
+    Left alone, every KMeans fit starts a thread per core, and with
+    WEB_CONCURRENCY gunicorn workers each running ``concurrent_fits`` fits
+    the CPUs are oversubscribed many times over. POVERTY_NATIVE_THREADS
+    sets the number directly.
+    """
+    configured = int(os.environ.get('POVERTY_NATIVE_THREADS', 0))
+    if configured > 0:
+        return configured
+    web_workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+    return max(1, (os.cpu_count() or 1) // (web_workers * concurrent_fits))
+
+
+def _fit(features, n_clusters, random_state):
+    return KMeans(n_clusters=n_clusters, random_state=random_state).fit(features)
+
+
+def kmeans_labels(features, n_clusters, random_state=0):
+    """Fit KMeans on standardized ``features`` (see PovertyData.cluster_features).
+
+    A plain function of a NumPy array, so background jobs can run it in a
+    child process without importing the app or its data.
+    """
+    kmeans = _fit(features, n_clusters, random_state)
+    return {'labels': kmeans.labels_.astype(np.int16), 'inertia': kmeans.inertia_}
+
+
+def kmeans_sweep(features, cluster_counts=SWEEP_CLUSTERS, random_state=0):
+    """kmeans_labels() for every number of clusters.
+
+    Returns the numbers of clusters that fit the data (fewer than the
+    number of rows), a row of labels for each and the inertia and
+    silhouette score curves.
+    """
+    ks = [k for k in cluster_counts if k < len(features)]
+    labels = np.empty((len(ks), len(features)), dtype=np.int16)
+    inertia = np.empty(len(ks))
+    silhouette = np.full(len(ks), np.nan)
+    for i, k in enumerate(ks):
+        kmeans = _fit(features, k, random_state)
+        labels[i] = kmeans.labels_
+        inertia[i] = kmeans.inertia_
+        if len(np.unique(kmeans.labels_)) > 1:
+            silhouette[i] = silhouette_score(features, kmeans.labels_)
+    return {'ks': np.array(ks), 'labels': labels, 'inertia': inertia, 'silhouette': silhouette}
@@ -0,0 +1,133 @@
+"""Response compression for the dashboard.
+
+enable_compression() puts Flask-Compress in front of the server, so
+callback responses (``_dash-update-component``), the layout and any other
+text response over COMPRESS_MIN_SIZE bytes are compressed with the first
+algorithm in COMPRESS_ALGORITHM that the browser accepts:
+
+    POVERTY_COMPRESS_ALGORITHM=br,gzip  POVERTY_COMPRESS_MIN_SIZE=1024
+
+The JS bundles never change between deploys, and compressing plotly.js
+(~3.5 MB) on every request costs more than it saves. Run
+
+    python compression.py
+
+at build time to write .br and .gz copies of every bundle the app serves
+under CACHE_DIR/static, at the highest levels. When a copy exists for the
+requested bundle and encoding it is sent as is, with a one-year immutable
+Cache-Control for fingerprinted URLs; otherwise Dash serves the bundle and
+Flask-Compress compresses it on the fly.
+"""
+import gzip
+import mimetypes
+import os
+import pkgutil
+import sys
+
+import brotli
+import flask
+from dash.fingerprint import check_fingerprint
+from flask_compress import Compress
+
+from data_loader import CACHE_DIR
+
+
+COMPRESS_ALGORITHM = os.environ.get('POVERTY_COMPRESS_ALGORITHM', 'br,gzip').split(',')
+COMPRESS_MIN_SIZE = int(os.environ.get('POVERTY_COMPRESS_MIN_SIZE', 1024))
+STATIC_DIR = os.path.join(CACHE_DIR, 'static')
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+ONE_YEAR = 31536000
+SUITES_ROUTE = '_dash-component-suites/<string:package_name>/<path:fingerprinted_path>'
+
+
+def precompressed_path(package_name, path_in_pkg, encoding):
+    version = getattr(sys.modules.get(package_name), '__version__', 'unknown')
+    return os.path.join(STATIC_DIR, package_name, str(version),
+                        path_in_pkg + SUFFIXES[encoding])
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9)
+
+
+def registered_bundles(app):
+    """(package, path) of every bundle the app's index page loads."""
+    # Dash registers the bundle paths while rendering the index page.
+    app.server.test_client().get(app.config.routes_pathname_prefix)
+    return [(package_name, path)
+            for package_name, paths in sorted(app.registered_paths.items())
+            for path in sorted(paths)]
+
+
+def precompress_bundles(app, encodings=('br', 'gzip')):
+    written = []
+    for package_name, path_in_pkg in registered_bundles(app):
+        try:
+            data = pkgutil.get_data(package_name, path_in_pkg)
+        except FileNotFoundError:
+            # Source maps are registered but not shipped in every release.
+            continue
+        if len(data) < COMPRESS_MIN_SIZE:
+            continue
+        for encoding in encodings:
+            path = precompressed_path(package_name, path_in_pkg, encoding)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(_compress(data, encoding))
+            os.replace(tmp_path, path)
+            written.append((path, len(data), os.path.getsize(path)))
+    return written
+
+
+def _find_precompressed(app, package_name, path_in_pkg):
+    # Only bundles Dash itself would serve, which also keeps path_in_pkg
+    # from pointing outside STATIC_DIR.
+    if path_in_pkg not in app.registered_paths.get(package_name, ()):
+        return None, None
+    accepted = flask.request.accept_encodings
+    for encoding in COMPRESS_ALGORITHM:
+        if encoding in SUFFIXES and accepted[encoding]:
+            path = precompressed_path(package_name, path_in_pkg, encoding)
+            if os.path.exists(path):
+                return encoding, path
+    return None, None
+
+
+def enable_compression(app):
+    """Compress dynamic responses and serve precompressed bundles.
+
+    Create the app with ``dash.Dash(..., compress=False)``: Dash would
+    otherwise set up Flask-Compress itself, gzip only.
+    """
+    server = app.server
+    server.config['COMPRESS_ALGORITHM'] = COMPRESS_ALGORITHM
+    server.config['COMPRESS_MIN_SIZE'] = COMPRESS_MIN_SIZE
+    Compress(server)
+
+    endpoint = app.config.routes_pathname_prefix + SUITES_ROUTE
+    serve_bundle = server.view_functions[endpoint]
+
+    def serve_precompressed(package_name, fingerprinted_path):
+        path_in_pkg, has_fingerprint = check_fingerprint(fingerprinted_path)
+        encoding, path = _find_precompressed(app, package_name, path_in_pkg)
+        if path is None:
+            return serve_bundle(package_name, fingerprinted_path)
+        mimetype = mimetypes.guess_type(path_in_pkg)[0] or 'application/octet-stream'
+        response = flask.send_file(path, mimetype=mimetype, conditional=True)
+        response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        if has_fingerprint:
+            response.headers['Cache-Control'] = f'public, max-age={ONE_YEAR}, immutable'
+        return response
+
+    server.view_functions[endpoint] = serve_precompressed
+    return app
+
+
+if __name__ == '__main__':
+    from app_v11_1 import app
+    for path, size, compressed in precompress_bundles(app):
+        print(f'{size:>9} -> {compressed:>9}  {os.path.relpath(path, STATIC_DIR)}')
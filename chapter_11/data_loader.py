@@ -0,0 +1,180 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401 -- required by DataFrame.to_feather/read_feather
+except ImportError:
+    pyarrow = None
+
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+CACHE_DIR = os.environ.get('POVERTY_CACHE_DIR', os.path.join(DATA_DIR, '.cache'))
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _cache_paths(filename, read_kwargs):
+    options = json.dumps(read_kwargs, sort_keys=True, default=str)
+    key = hashlib.sha1(options.encode()).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    cache_path = os.path.join(CACHE_DIR, f'{stem}-{key}.feather')
+    return cache_path, cache_path + '.json'
+
+
+def _fresh_meta(source, meta_path):
+    """The cache metadata if it still describes ``source``, else None."""
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    signature = file_signature(source)
+    if all(meta.get(k) == v for k, v in signature.items()):
+        return meta
+    # size/mtime changed (e.g. the file was copied or touched): only a
+    # content change forces a rebuild.
+    if meta.get('size') != signature['size'] or meta.get('sha256') != file_hash(source):
+        return None
+    meta = dict(meta, **signature)
+    _write_json(meta_path, meta)
+    return meta
+
+
+def _write_json(path, obj):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f)
+    os.replace(tmp_path, path)
+
+
+def read_header(filename):
+    return pd.read_csv(os.path.join(DATA_DIR, filename), nrows=0).columns.tolist()
+
+
+def _read_cached(filename, read_kwargs):
+    """(frame, Feather cache path, sha256 of the CSV it was read from)."""
+    source = os.path.join(DATA_DIR, filename)
+    if pyarrow is None:
+        return pd.read_csv(source, **read_kwargs), None, None
+
+    cache_path, meta_path = _cache_paths(filename, read_kwargs)
+    meta = _fresh_meta(source, meta_path) if os.path.exists(cache_path) else None
+    if meta is not None:
+        return pd.read_feather(cache_path), cache_path, meta['sha256']
+
+    signature = file_signature(source)
+    sha256 = file_hash(source)
+    df = pd.read_csv(source, **read_kwargs)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    df.to_feather(tmp_path)
+    os.replace(tmp_path, cache_path)
+    _write_json(meta_path, dict(signature, sha256=sha256))
+    return df, cache_path, sha256
+
+
+def read_csv_cached(filename, **read_kwargs):
+    """Read a CSV from DATA_DIR through an on-disk Feather copy.
+
+    The Feather file is rebuilt whenever the source CSV's size, mtime or
+    content hash changes, or when different ``read_kwargs`` are used.
+    """
+    return _read_cached(filename, read_kwargs)[0]
+
+
+def _shared_frame(df, float_block):
+    # float_block is stored column-major (one row per column), which is the
+    # layout pandas uses internally, so .T gives it a view rather than a copy.
+    shared = pd.DataFrame(float_block.T, columns=df.columns[df.dtypes.eq('float64')],
+                          copy=False)
+    # insert() adds a block per column and leaves the float block untouched,
+    # so the frame keeps pointing at the memory-mapped file.
+    for position, col in enumerate(df.columns):
+        if col not in shared.columns:
+            shared.insert(position, col, df[col].values)
+    return shared
+
+
+def read_csv_shared(filename, float_dtype='float64', **read_kwargs):
+    """Like read_csv_cached, with all float columns in one read-only memmap.
+
+    The float block lives in an .npy file next to the Feather cache and is
+    mapped with ``mmap_mode='r'``, so its pages are clean, file-backed and
+    shared by every process that loads the same file (forked gunicorn
+    workers included) instead of being copied per worker. Pass
+    ``float_dtype='float32'`` to halve the size of the block.
+    """
+    df, cache_path, sha256 = _read_cached(filename, read_kwargs)
+    if cache_path is None:
+        return df.astype({col: float_dtype for col in df.columns[df.dtypes.eq('float64')]})
+    # Named after the content of the CSV the frame came from, so a block
+    # left over from (or not yet rewritten after) another version of the
+    # file is never paired with this one's other columns.
+    prefix = cache_path.replace('.feather', '.')
+    npy_path = f'{prefix}{sha256[:16]}.{float_dtype}.npy'
+    if not os.path.exists(npy_path):
+        block = df.loc[:, df.dtypes.eq('float64')].values.T
+        tmp_path = f'{npy_path}.{os.getpid()}.tmp.npy'
+        np.save(tmp_path, np.ascontiguousarray(block, dtype=float_dtype))
+        os.replace(tmp_path, npy_path)
+        for old_path in glob.glob(f'{glob.escape(prefix)}*.{float_dtype}.npy'):
+            if old_path != npy_path:
+                # Processes still mapping it keep their pages until they unmap.
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+    return _shared_frame(df, np.load(npy_path, mmap_mode='r'))
+
+
+def float64_values(values):
+    """``values`` as float64, with float32 ones at their shortest decimal form.
+
+    A float32 24.8 is 24.799999237060547 as a float64; going through its
+    shortest string gives back 24.8, so figures and tables built from a
+    float32 block (POVERTY_FLOAT_DTYPE=float32) show the stored values.
+    """
+    values = np.asarray(values)
+    if values.dtype == np.float32:
+        return values.astype(str).astype(np.float64)
+    return values
+
+
+def remove_versions_except(directory, version):
+    """Delete the per-version subdirectories of ``directory`` other than ``version``."""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        if name != version:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def memory_report(before, after):
+    """Bytes per column of two versions of the same frame, largest first."""
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'bytes_before': before.memory_usage(index=False, deep=True),
+        'dtype_after': after.dtypes.astype(str),
+        'bytes_after': after.memory_usage(index=False, deep=True),
+    })
+    total = report[['bytes_before', 'bytes_after']].sum().to_frame('TOTAL').T
+    return pd.concat([report.sort_values('bytes_before', ascending=False), total])
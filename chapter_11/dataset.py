@@ -0,0 +1,383 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from data_loader import (DATA_DIR, file_hash, file_signature, float64_values, memory_report,
+                         read_csv_cached, read_csv_shared, read_header)
+
+
+logger = logging.getLogger(__name__)
+
+gini = 'GINI index (World Bank estimate)'
+
+regions = ['East Asia & Pacific', 'Europe & Central Asia',
+           'Fragile and conflict affected situations', 'High income',
+           'IDA countries classified as fragile situations', 'IDA total',
+           'Latin America & Caribbean', 'Low & middle income', 'Low income',
+           'Lower middle income', 'Middle East & North Africa',
+           'Middle income', 'South Asia', 'Sub-Saharan Africa',
+           'Upper middle income', 'World']
+
+# Country names and codes repeat once per year, and years fit in 16 bits.
+# The remaining string columns (the PovStatsCountry metadata joined onto
+# every row) are made categorical after loading, see compact_strings().
+# Float columns can additionally be stored as float32 with
+# POVERTY_FLOAT_DTYPE=float32, at the cost of ~7 significant digits. The
+# Gini charts, the poverty gap chart, cluster hovers and the histogram
+# table go through float64_values() to show the stored decimals; the
+# indicator maps and the country line charts show float32 values as they
+# are (24.799999 rather than 24.8 in hovers).
+POVERTY_SCHEMA = {'Country Name': 'category',
+                  'Country Code': 'category',
+                  'year': 'int16'}
+FLOAT_DTYPE = os.environ.get('POVERTY_FLOAT_DTYPE', 'float64')
+
+SERIES_COLUMNS = ['Indicator Name', 'Long definition', 'Unit of measure',
+                  'Periodicity', 'Source', 'Limitations and exceptions']
+
+TABLE_FILES = {'poverty': 'poverty.csv',
+               'poverty_data': 'PovStatsData.csv',
+               'series': 'PovStatsSeries.csv',
+               'country_df': 'PovStatsCountry.csv'}
+
+
+def named(col):
+    return not col.startswith('Unnamed')
+
+
+# Which columns of which tables to load: a list of names, a predicate on
+# the column name, or None for all of them. ``poverty`` is required; the
+# other tables can be left out, and are then not read at all, and the
+# frames derived from them are not built (or are empty, for ``series``).
+ALL_TABLES = {'poverty': None,
+              'poverty_data': named,
+              'series': SERIES_COLUMNS + ['Series Code'],
+              'country_df': named}
+
+
+def indicator_columns():
+    return read_header(TABLE_FILES['poverty'])[3:54]
+
+
+def compact_strings(df):
+    object_cols = df.columns[df.dtypes.eq(object)]
+    for col in object_cols:
+        df[col] = df[col].astype('category')
+    return df
+
+
+def group_positions(positions, keys):
+    """Sort ``positions`` by ``keys`` and return them with a key -> slice map."""
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    uniques, starts = np.unique(sorted_keys, return_index=True)
+    ends = np.append(starts[1:], len(order))
+    slices = {key: slice(start, end)
+              for key, start, end in zip(uniques.tolist(), starts, ends)}
+    return positions[order], slices
+
+
+def standardize(values):
+    """Mean-impute and standardize the columns of ``values``.
+
+    The same as SimpleImputer(strategy='mean') followed by StandardScaler,
+    except that all-NaN columns are kept (as NaN). Each column is
+    handled on its own, so the result for a subset of the columns is the
+    same subset of the result. Returns the float32 matrix and the column
+    means and standard deviations.
+    """
+    missing = np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.nansum(values, axis=0) / (~missing).sum(axis=0)
+    filled = np.where(missing, means, values)
+    stds = filled.std(axis=0)
+    stds[stds == 0] = 1
+    return ((filled - means) / stds).astype(np.float32), means, stds
+
+
+def make_indicator_markdown(series):
+    series = series.assign(**{
+        'Limitations and exceptions': series['Limitations and exceptions']
+                                      .fillna('N/A').str.replace('\n\n', ' '),
+        'Unit of measure': series['Unit of measure'].fillna('count'),
+        'Periodicity': series['Periodicity'].fillna('N/A'),
+    })
+    markdown = {}
+    rows = series.itertuples(index=False, name=None)
+    for name, definition, unit, periodicity, source, limitations in rows:
+        markdown[name] = f"""
+    ## {name}  
+
+    {definition}  
+
+    * **Unit of measure** {unit}
+    * **Periodicity** {periodicity}
+    * **Source** {source}
+
+    ### Limitations and exceptions:  
+
+    {limitations}  
+
+    """
+    return markdown
+
+
+class PovertyData:
+    """All the frames the dashboard reads, built once per process.
+
+    Load this at import time of the app module and run gunicorn with
+    ``preload_app`` (see gunicorn.conf.py): the master builds it once and
+    the forked workers share it. The numeric columns of ``poverty`` and
+    ``poverty_data`` are backed by read-only memory-mapped files, so
+    workers never copy them, even when refcount updates dirty the pages
+    holding the Python objects.
+    """
+
+    def __init__(self, poverty, poverty_data, series, country_df, sources=(), version=None):
+        self.sources = list(sources)
+        self.version = version
+        self.poverty = poverty
+        self.poverty_data = poverty_data
+        self.country_df = country_df
+
+        self.indicators = poverty.columns[3:54]
+        self.indicator_info = {}
+        self.indicator_markdown = {}
+        if series is not None:
+            indicator_series = (series[series['Indicator Name'].isin(self.indicators)]
+                                .drop_duplicates('Indicator Name'))
+            self.indicator_info = indicator_series.set_index('Indicator Name').to_dict('index')
+            self.indicator_markdown = make_indicator_markdown(indicator_series[SERIES_COLUMNS])
+        self.gini_df = poverty[poverty[gini].notna()]
+        # Each year's (Gini values, country names) in ascending order of
+        # value, and each country's (years, Gini values), for the bar charts.
+        by_value = self.gini_df.sort_values(gini, kind='mergesort')
+        self.gini_by_year = {year: (float64_values(df[gini]),
+                                    df['Country Name'].astype(str).tolist())
+                             for year, df in by_value.groupby('year', sort=True)}
+        self.gini_by_country = {country: (df['year'].to_numpy(), float64_values(df[gini]))
+                                for country, df in self.gini_df.groupby(
+                                    self.gini_df['Country Name'].astype(str), sort=False)}
+        self.gini_years = list(self.gini_by_year)
+        self.gini_countries = list(self.gini_by_country)
+        # The same values as a countries x years table (NaN where there is
+        # none), for the heatmap that replaces the facets for many countries.
+        self.gini_pivot = np.full((len(self.gini_countries), len(self.gini_years)), np.nan)
+        for i, (years, values) in enumerate(self.gini_by_country.values()):
+            self.gini_pivot[i, np.searchsorted(self.gini_years, years)] = values
+        self._gini_country_index = {country: i for i, country in enumerate(self.gini_countries)}
+        self.population_df = None
+        if poverty_data is not None:
+            self.population_df = poverty_data[~poverty_data['Country Name'].isin(regions) &
+                                              (poverty_data['Indicator Name'] == 'Population, total')]
+
+        income_share_df = poverty.filter(regex='Country Name|^year$|Income share.*?20').dropna()
+        income_share_df = income_share_df.rename(columns={
+            'Income share held by lowest 20%': '1 Income share held by lowest 20%',
+            'Income share held by second 20%': '2 Income share held by second 20%',
+            'Income share held by third 20%': '3 Income share held by third 20%',
+            'Income share held by fourth 20%': '4 Income share held by fourth 20%',
+            'Income share held by highest 20%': '5 Income share held by highest 20%'
+        }).sort_index(axis=1)
+        income_share_df.columns = [re.sub(r'\d Income share held by ', '', col).title()
+                                   for col in income_share_df.columns]
+        self.income_share_df = income_share_df
+        self.income_share_cols = income_share_df.columns[:-2]
+
+        self.perc_pov_cols = poverty.filter(regex='Poverty gap').columns
+        self.perc_pov_df = poverty[poverty['is_country']].dropna(subset=self.perc_pov_cols)
+        self.perc_pov_years = sorted(set(self.perc_pov_df['year']))
+
+        self.countries = (poverty[poverty['is_country']]['Country Name']
+                          .drop_duplicates().sort_values().tolist())
+
+        # Row positions of the country (non-aggregate) rows, grouped by year
+        # and by country, so callbacks can take() the rows they need instead
+        # of building a boolean mask over the whole table.
+        self.country_positions = np.flatnonzero(poverty['is_country'].to_numpy())
+        self._by_year, self._year_slices = group_positions(
+            self.country_positions, poverty['year'].to_numpy()[self.country_positions])
+        self._by_country, self._country_slices = group_positions(
+            self.country_positions,
+            poverty['Country Name'].astype(str).to_numpy()[self.country_positions])
+
+        # Standardized indicator matrix of each year's country rows (in
+        # _by_year order) with the means and standard deviations used, so
+        # clustering any subset of indicators only slices it.
+        self.feature_years = sorted(self._year_slices)
+        values = poverty[self.indicators].to_numpy(dtype=np.float64)[self._by_year]
+        self.features = np.empty(values.shape, dtype=np.float32)
+        self.feature_means = np.empty((len(self.feature_years), len(self.indicators)))
+        self.feature_stds = np.empty_like(self.feature_means)
+        for i, year in enumerate(self.feature_years):
+            rows = self._year_slices[year]
+            self.features[rows], self.feature_means[i], self.feature_stds[i] = \
+                standardize(values[rows])
+        self._indicator_index = {indicator: i for i, indicator in enumerate(self.indicators)}
+
+        # Years with data and value range of each indicator over the
+        # country rows, for the one-year-at-a-time indicator map.
+        country_rows = self.country_rows()
+        self.indicator_years = {}
+        self.indicator_range = {}
+        for indicator in self.indicators:
+            values = country_rows[indicator]
+            self.indicator_years[indicator] = sorted(set(country_rows['year'][values.notna()].tolist()))
+            self.indicator_range[indicator] = [values.min(), values.max()]
+
+    def _take(self, grouped, slices, keys):
+        parts = [grouped[slices[key]] for key in keys if key in slices]
+        if not parts:
+            return self.poverty.iloc[:0]
+        # Keep the table order, which is what the boolean masks returned.
+        return self.poverty.take(np.sort(np.concatenate(parts)))
+
+    def country_rows(self):
+        return self.poverty.take(self.country_positions)
+
+    def rows_for_years(self, years):
+        return self._take(self._by_year, self._year_slices, years)
+
+    def rows_for_countries(self, countries):
+        return self._take(self._by_country, self._country_slices, countries)
+
+    def gini_table(self, countries):
+        """Rows of gini_pivot for ``countries`` (in gini_countries order), without empty years.
+
+        Returns (values, countries, years).
+        """
+        rows = sorted(self._gini_country_index[country] for country in set(countries)
+                      if country in self._gini_country_index)
+        values = self.gini_pivot[rows]
+        columns = np.flatnonzero(~np.isnan(values).all(axis=0))
+        return (values[:, columns], [self.gini_countries[i] for i in rows],
+                [self.gini_years[i] for i in columns])
+
+    def cluster_features(self, year, indicators):
+        """Standardized values of ``indicators`` for the rows of rows_for_years([year])."""
+        columns = [self._indicator_index[indicator] for indicator in indicators]
+        rows = self._year_slices.get(year, slice(0, 0))
+        return self.features[rows][:, columns]
+
+    @classmethod
+    def load(cls, tables=ALL_TABLES, float_dtype=FLOAT_DTYPE):
+        """Load the tables named in ``tables``, reading only the listed columns.
+
+        Raises ValueError if ``tables`` leaves out ``poverty``.
+        """
+        if 'poverty' not in tables:
+            raise ValueError("PovertyData needs the 'poverty' table")
+
+        def usecols(table):
+            columns = tables[table]
+            if callable(columns):
+                columns = [col for col in read_header(TABLE_FILES[table]) if columns(col)]
+            return columns
+
+        poverty = read_csv_shared(TABLE_FILES['poverty'], float_dtype=float_dtype,
+                                  usecols=usecols('poverty'), dtype=POVERTY_SCHEMA,
+                                  low_memory=False)
+        poverty_data = None
+        if 'poverty_data' in tables:
+            poverty_data = read_csv_shared(TABLE_FILES['poverty_data'], float_dtype=float_dtype,
+                                           usecols=usecols('poverty_data'))
+        series = None
+        if 'series' in tables:
+            series = read_csv_cached(TABLE_FILES['series'], usecols=usecols('series'))
+        country_df = None
+        if 'country_df' in tables:
+            country_df = read_csv_cached(TABLE_FILES['country_df'], usecols=usecols('country_df'))
+        sources = [TABLE_FILES[table] for table in TABLE_FILES if table in tables]
+        return cls(poverty=compact_strings(poverty),
+                   poverty_data=poverty_data,
+                   series=series,
+                   country_df=country_df,
+                   sources=sources,
+                   version=data_version(sources))
+
+
+def data_version(filenames):
+    """Short content hash of the given data files, the same in every process."""
+    hashes = ''.join(file_hash(os.path.join(DATA_DIR, name)) for name in filenames)
+    return hashlib.sha1(hashes.encode()).hexdigest()[:12]
+
+
+class DataStore:
+    """Double buffer for PovertyData that follows changes to the data files.
+
+    Callbacks read ``store.current`` once and use that snapshot for the
+    whole request. The watcher thread polls the source files; once one
+    has changed and stayed unchanged for a poll interval it builds a
+    complete new PovertyData in the background and then replaces
+    ``current`` in a single assignment, so requests never see a
+    half-loaded dataset and never wait for the load. Functions registered
+    with on_reload() are then called with the old and new data, e.g. to
+    drop figure caches keyed on the old version.
+    """
+
+    def __init__(self, loader, interval=None):
+        self._loader = loader
+        self.interval = interval if interval is not None else \
+            float(os.environ.get('POVERTY_RELOAD_INTERVAL', 60))
+        self.current = loader()
+        self._signatures = self._read_signatures(self.current)
+        self._pending = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._watcher_pid = None
+
+    @staticmethod
+    def _read_signatures(data):
+        return {name: file_signature(os.path.join(DATA_DIR, name)) for name in data.sources}
+
+    def on_reload(self, listener):
+        self._listeners.append(listener)
+        return listener
+
+    def reload_if_changed(self):
+        with self._lock:
+            old = self.current
+            signatures = self._read_signatures(old)
+            if signatures == self._signatures:
+                return False
+            # Only reload once the files have stopped changing between two
+            # polls, so a file that is still being copied is not picked up.
+            if signatures != self._pending:
+                self._pending = signatures
+                return False
+            new = self._loader()
+            self._signatures = self._read_signatures(new)
+            if new.version == old.version:
+                return False
+            self.current = new
+        logger.info('Data reloaded: version %s -> %s', old.version, new.version)
+        for listener in self._listeners:
+            listener(old, new)
+        return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.reload_if_changed()
+            except Exception:
+                logger.exception('Data reload failed, keeping version %s', self.current.version)
+
+    def start_watcher(self):
+        """Start polling in this process (call again after a fork)."""
+        if self.interval <= 0 or self._watcher_pid == os.getpid():
+            return
+        self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, name='data-watcher', daemon=True).start()
+
+if __name__ == '__main__':
+    import pandas as pd
+    pd.set_option('display.max_rows', None, 'display.width', 200)
+    before = read_csv_cached('poverty.csv', low_memory=False)
+    after = PovertyData.load().poverty
+    print(memory_report(before, after))
@@ -0,0 +1,104 @@
+"""Base64 typed-array encoding for the numeric arrays of a figure.
+
+plotly's JSON encoder writes every number as text, and Dash runs the whole
+response through it (dump, parse, dump again). encode_figure() replaces
+each long 1-D numeric array in the figure with
+
+    {'dtype': 'f8', 'bdata': '<base64 of the raw little-endian buffer>'}
+
+which NumPy produces in one pass. assets/figure_decoding.js turns these
+back into JavaScript typed arrays in the browser before the figure reaches
+dcc.Graph, see decoded_graph().
+
+For the arrays of a few hundred short decimals that the PovStats figures
+hold, text JSON is about as compact, so only arrays of at least MIN_LENGTH
+values are encoded. The gain is for large arrays: a 100k-value float
+array is ~1.1 MB of base64 produced in about a millisecond, against ~1.8 MB
+of text that plotly's encoder walks three times.
+"""
+import base64
+
+import dash_core_components as dcc
+import dash_html_components as html
+import numpy as np
+from dash.dependencies import ClientsideFunction, Input, Output
+
+
+MIN_LENGTH = 256
+INT_DTYPES = [np.int8, np.int16, np.int32]
+
+
+def encode_array(values, float_dtype='f8'):
+    """Encoded form of ``values``, or None if it is not a numeric 1-D array."""
+    if isinstance(values, np.ndarray):
+        arr = values
+    elif all(value is None or (isinstance(value, (int, float)) and not isinstance(value, bool))
+             for value in values):
+        arr = np.array(values, dtype=float)
+    else:
+        return None
+    if arr.ndim != 1 or arr.dtype.kind not in 'biuf':
+        return None
+    # Whole floats go through int64 only when they fit int32 (the widest
+    # integer type sent), so that huge values are not wrapped by the cast.
+    if (arr.dtype.kind == 'f' and len(arr) and np.isfinite(arr).all()
+            and (arr == np.round(arr)).all() and np.abs(arr).max() <= np.iinfo(np.int32).max):
+        arr = arr.astype(np.int64)
+    if arr.dtype.kind in 'biu':
+        for dtype in INT_DTYPES:
+            info = np.iinfo(dtype)
+            if len(arr) == 0 or (arr.min() >= info.min and arr.max() <= info.max):
+                arr = arr.astype(dtype)
+                break
+        else:
+            arr = arr.astype(float_dtype)
+    else:
+        arr = arr.astype(float_dtype)
+    arr = arr.astype(arr.dtype.newbyteorder('<'), copy=False)
+    return {'dtype': f'{arr.dtype.kind}{arr.dtype.itemsize}',
+            'bdata': base64.b64encode(arr.tobytes()).decode('ascii')}
+
+
+def _encode(obj, float_dtype, min_length):
+    if isinstance(obj, dict):
+        return {key: _encode(value, float_dtype, min_length) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple, np.ndarray)):
+        if len(obj) >= min_length:
+            encoded = encode_array(obj, float_dtype)
+            if encoded is not None:
+                return encoded
+        if isinstance(obj, np.ndarray):
+            return obj
+        return [_encode(value, float_dtype, min_length) for value in obj]
+    return obj
+
+
+def encode_figure(fig, float_dtype='f8', min_length=MIN_LENGTH):
+    """Copy of ``fig`` with the numeric arrays of its traces and frames encoded.
+
+    Integer-valued arrays use the narrowest of int8/int16/int32; other
+    arrays use ``float_dtype`` ('f8', or 'f4' for ~7 significant digits
+    and half the bytes). NaN and None both become NaN, which plotly treats
+    as a gap, like null.
+    """
+    if not isinstance(fig, dict):
+        fig = fig.to_plotly_json()
+    encoded = dict(fig)
+    encoded['data'] = _encode(fig.get('data', []), float_dtype, min_length)
+    if 'frames' in fig:
+        encoded['frames'] = [dict(frame, data=_encode(frame.get('data', []), float_dtype, min_length))
+                             for frame in fig['frames']]
+    return encoded
+
+
+def decoded_graph(app, graph_id, **graph_kwargs):
+    """A dcc.Graph fed by a dcc.Store holding an encode_figure() result.
+
+    Server callbacks write to ``Output(graph_id + '_encoded', 'data')``; a
+    clientside callback decodes the arrays and sets the graph's figure.
+    """
+    store_id = graph_id + '_encoded'
+    app.clientside_callback(ClientsideFunction(namespace='figures', function_name='decode'),
+                            Output(graph_id, 'figure'),
+                            Input(store_id, 'data'))
+    return html.Div([dcc.Store(id=store_id), dcc.Graph(id=graph_id, **graph_kwargs)])
@@ -0,0 +1,64 @@
+"""Streaming CSV and Parquet exports of in-memory frames.
+
+Each generator serializes ``chunk_rows`` rows at a time and yields the
+bytes, so a Flask response built on it starts sending at once and never
+holds the whole file in memory.
+"""
+import io
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+CHUNK_ROWS = 10000
+MIMETYPES = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+
+def stream_csv(df, chunk_rows=CHUNK_ROWS):
+    yield df.iloc[:0].to_csv(index=False).encode()
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=False).encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last take()."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_parquet(df, chunk_rows=CHUNK_ROWS):
+    """One row group per chunk; raises RuntimeError without pyarrow."""
+    if pq is None:
+        raise RuntimeError('Parquet export requires pyarrow')
+    sink = _ChunkSink()
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(sink, schema) as writer:
+        for start in range(0, len(df), chunk_rows):
+            chunk = df.iloc[start:start + chunk_rows]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.take()
+    yield sink.take()
+
+
+STREAMS = {'csv': stream_csv, 'parquet': stream_parquet}
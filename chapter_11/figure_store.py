@@ -0,0 +1,130 @@
+"""Serialized figures, rendered once per data version.
+
+Building the animated indicator map with plotly.express takes a few
+hundred milliseconds and is identical for every user until the data
+changes. FigureStore keeps each rendered figure as gzipped JSON in an
+in-memory LRU and under CACHE_DIR/figures/<name>/<format>/<data version>/,
+so a request only has to decompress and parse it. <format> combines
+figures.FIGURES_VERSION with the plotly version, so a deploy that changes
+either never serves figures rendered by the old code. Render everything
+ahead of time with
+
+    python figure_store.py
+
+or set POVERTY_WARM_FIGURES=1 to do it when the app starts (in the
+gunicorn master, before the workers fork).
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import plotly
+import plotly.io as pio
+
+from data_loader import CACHE_DIR, remove_versions_except
+from figures import FIGURES_VERSION
+
+
+FORMAT_VERSION = f'{FIGURES_VERSION}-plotly{plotly.__version__}'
+
+
+class FigureStore:
+
+    def __init__(self, name, build, cache_dir=CACHE_DIR, compresslevel=6, maxsize=128):
+        self.name = name
+        self.build = build
+        self.directory = os.path.join(cache_dir, 'figures', name, FORMAT_VERSION)
+        self.compresslevel = compresslevel
+        self.maxsize = maxsize
+        self._blobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._prefetching = set()
+        self._executor = None
+
+    def _path(self, version, key):
+        digest = hashlib.sha1(json.dumps(key).encode()).hexdigest()[:16]
+        return os.path.join(self.directory, version, digest + '.json.gz')
+
+    def _remember(self, cache_key, blob):
+        with self._lock:
+            self._blobs[cache_key] = blob
+            self._blobs.move_to_end(cache_key)
+            while len(self._blobs) > self.maxsize:
+                self._blobs.popitem(last=False)
+
+    def get_bytes(self, data, key):
+        """Gzipped JSON of the figure for ``key``, rendering it if needed."""
+        cache_key = (data.version, key)
+        with self._lock:
+            blob = self._blobs.get(cache_key)
+            if blob is not None:
+                self._blobs.move_to_end(cache_key)
+                return blob
+        path = self._path(data.version, key)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+        except OSError:
+            fig = self.build(data, key)
+            blob = gzip.compress(pio.to_json(fig, validate=False).encode(),
+                                 compresslevel=self.compresslevel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp_path, path)
+        self._remember(cache_key, blob)
+        return blob
+
+    def get(self, data, key):
+        return json.loads(gzip.decompress(self.get_bytes(data, key)))
+
+    def warm(self, data, keys):
+        for key in keys:
+            self.get_bytes(data, key)
+
+    def prefetch(self, data, keys):
+        """Render the figures for ``keys`` in a background thread."""
+        with self._lock:
+            keys = [key for key in keys
+                    if (data.version, key) not in self._blobs
+                    and (data.version, key) not in self._prefetching]
+            if not keys:
+                return
+            # Created lazily: executor threads would not survive a fork.
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1,
+                                                    thread_name_prefix=f'prefetch-{self.name}')
+            self._prefetching.update((data.version, key) for key in keys)
+        for key in keys:
+            self._executor.submit(self._prefetch_one, data, key)
+
+    def _prefetch_one(self, data, key):
+        try:
+            self.get_bytes(data, key)
+        finally:
+            self._prefetching.discard((data.version, key))
+
+    def drop_versions_except(self, version):
+        """Forget the figures of other data versions, in memory and on disk."""
+        with self._lock:
+            for cache_key in list(self._blobs):
+                if cache_key[0] != version:
+                    self._blobs.pop(cache_key, None)
+        remove_versions_except(self.directory, version)
+
+
+if __name__ == '__main__':
+    import time
+    from app_v11_1 import indicator_maps, store
+
+    data = store.current
+    start = time.time()
+    indicator_maps.warm(data, list(data.indicators))
+    size = sum(len(blob) for blob in indicator_maps._blobs.values())
+    print(f'Rendered {len(data.indicators)} indicator maps for data version '
+          f'{data.version} in {time.time() - start:.1f}s ({size / 1e6:.1f} MB gzipped)')
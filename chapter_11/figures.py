@@ -0,0 +1,283 @@
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+
+
+# Part of the path of the figures FigureStore keeps on disk: change it
+# whenever a builder here changes what it draws.
+FIGURES_VERSION = '1'
+
+# The builders below return plain figure dicts with the same traces and
+# layout that plotly.express produces for these fixed chart shapes, but
+# without building (and validating) graph_objects or grouping a DataFrame.
+TEMPLATE = pio.templates[pio.templates.default].to_plotly_json()
+CIVIDIS = [[i / (len(px.colors.sequential.Cividis) - 1), color]
+           for i, color in enumerate(px.colors.sequential.Cividis)]
+
+
+def make_empty_fig():
+    fig = go.Figure()
+    fig.layout.paper_bgcolor = '#E5ECF6'
+    fig.layout.plot_bgcolor = '#E5ECF6'
+    return fig
+
+
+def multiline_indicator(indicator):
+    final = []
+    split = indicator.split()
+    for i in range(0, len(split), 3):
+        final.append(' '.join(split[i:i+3]))
+    return '<br>'.join(final)
+
+
+def _style_indicator_map(fig, indicator):
+    fig.layout.geo.showframe = False
+    fig.layout.geo.showcountries = True
+    fig.layout.geo.projection.type = 'natural earth'
+    fig.layout.geo.lataxis.range = [-53, 76]
+    fig.layout.geo.lonaxis.range = [-138, 167]
+    fig.layout.geo.landcolor = 'white'
+    fig.layout.geo.bgcolor = '#E5ECF6'
+    fig.layout.paper_bgcolor = '#E5ECF6'
+    fig.layout.geo.countrycolor = 'gray'
+    fig.layout.geo.coastlinecolor = 'gray'
+    fig.layout.coloraxis.colorbar.title = multiline_indicator(indicator)
+    return fig
+
+
+def make_indicator_map(df, indicator):
+    fig = px.choropleth(df, locations='Country Code',
+                        color=indicator,
+                        title=indicator,
+                        hover_name='Country Name',
+                        color_continuous_scale='cividis',
+                        animation_frame='year', height=650)
+    return _style_indicator_map(fig, indicator)
+
+
+def make_indicator_year_map(df, indicator, range_color):
+    fig = px.choropleth(df, locations='Country Code',
+                        color=indicator,
+                        title=indicator,
+                        hover_name='Country Name',
+                        hover_data=['year'],
+                        color_continuous_scale='cividis',
+                        range_color=range_color,
+                        height=650)
+    return _style_indicator_map(fig, indicator)
+
+
+def _axes(x_title, y_title):
+    return {'xaxis': {'anchor': 'y', 'domain': [0.0, 1.0], 'title': {'text': x_title}},
+            'yaxis': {'anchor': 'x', 'domain': [0.0, 1.0], 'title': {'text': y_title}}}
+
+
+def gini_year_bar(values, countries, x_title, title, height):
+    trace = {'alignmentgroup': 'True',
+             'hovertemplate': f'{x_title}=%{{x}}<br>Country Name=%{{y}}<extra></extra>',
+             'legendgroup': '', 'marker': {'color': '#636efa'}, 'name': '',
+             'offsetgroup': '', 'orientation': 'h', 'showlegend': False,
+             'textposition': 'auto', 'x': np.asarray(values).tolist(), 'xaxis': 'x',
+             'y': list(countries), 'yaxis': 'y', 'type': 'bar'}
+    layout = dict(_axes(x_title, 'Country Name'),
+                  template=TEMPLATE, legend={'tracegroupgap': 0}, title={'text': title},
+                  barmode='relative', height=height, paper_bgcolor='#E5ECF6')
+    return {'data': [trace], 'layout': layout}
+
+
+def gini_country_bars(series, y_title, title, height, colors=TEMPLATE['layout']['colorway'],
+                      row_spacing=0.03):
+    """A row of bars per country from ``series``, [(country, years, values)].
+
+    Laid out like px.bar(..., facet_row='Country Name', color='Country Name'):
+    the first country is the top row, and subplot axes are numbered from the
+    bottom one.
+    """
+    n_rows = len(series)
+    cell_height = (1 - (n_rows - 1) * row_spacing) / n_rows if n_rows else 1
+    layout, traces, annotations = {}, [], []
+    for i, (country, years, values) in enumerate(series):
+        row = n_rows - 1 - i
+        suffix = '' if row == 0 else str(row + 1)
+        y0 = row * (cell_height + row_spacing)
+        xaxis = {'anchor': 'y' + suffix, 'domain': [0.0, 0.98]}
+        yaxis = {'anchor': 'x' + suffix, 'domain': [y0, y0 + cell_height],
+                 'title': {'text': y_title}}
+        if row == 0:
+            xaxis['title'] = {'text': 'year'}
+        else:
+            xaxis.update(matches='x', showticklabels=False)
+            yaxis['matches'] = 'y'
+        layout['xaxis' + suffix] = xaxis
+        layout['yaxis' + suffix] = yaxis
+        traces.append({'alignmentgroup': 'True',
+                       'hovertemplate': (f'Country Name={country}<br>year=%{{x}}'
+                                         f'<br>{y_title}=%{{y}}<extra></extra>'),
+                       'legendgroup': country, 'marker': {'color': colors[i % len(colors)]},
+                       'name': country, 'offsetgroup': country, 'orientation': 'v',
+                       'showlegend': True, 'textposition': 'auto',
+                       'x': np.asarray(years).tolist(), 'xaxis': 'x' + suffix,
+                       'y': np.asarray(values).tolist(), 'yaxis': 'y' + suffix, 'type': 'bar'})
+        annotations.append({'showarrow': False, 'text': f'Country Name={country}',
+                            'textangle': 90, 'x': 0.98, 'xanchor': 'left', 'xref': 'paper',
+                            'y': y0 + cell_height / 2, 'yanchor': 'middle', 'yref': 'paper'})
+    layout.update(template=TEMPLATE, annotations=annotations[::-1],
+                  legend={'title': {'text': 'Country Name'}, 'tracegroupgap': 0},
+                  title={'text': title}, barmode='relative', height=height,
+                  paper_bgcolor='#E5ECF6')
+    return {'data': traces, 'layout': layout}
+
+
+def gini_heatmap(values, countries, years, z_title, title, height):
+    """Countries (top to bottom) x years heatmap of a ``values`` table, NaN for no data."""
+    values = np.asarray(values, dtype=float)
+    trace = {'coloraxis': 'coloraxis', 'hoverongaps': False,
+             'hovertemplate': (f'Country Name=%{{y}}<br>year=%{{x}}<br>{z_title}=%{{z}}'
+                               '<extra></extra>'),
+             'name': '', 'x': list(years), 'xaxis': 'x', 'y': list(countries), 'yaxis': 'y',
+             'z': np.where(np.isnan(values), None, values).tolist(), 'type': 'heatmap'}
+    layout = _axes('year', 'Country Name')
+    layout['yaxis']['autorange'] = 'reversed'
+    layout.update(template=TEMPLATE,
+                  coloraxis={'colorbar': {'title': {'text': z_title}}, 'colorscale': CIVIDIS},
+                  title={'text': title}, height=height, paper_bgcolor='#E5ECF6')
+    return {'data': [trace], 'layout': layout}
+
+
+def perc_pov_scatter(values, countries, population, x_title, title, height,
+                     size=30, size_max=15, render_mode='svg'):
+    # One marker size for all the points, rather than a list of the same
+    # size per point as px.scatter(size=...) needs.
+    trace = {'hovertemplate': ('<b>%{hovertext}</b><br><br>' + x_title +
+                               f'=%{{x}}<br>Country Name=%{{y}}<br>size={size}'
+                               '<br>Population, total=%{marker.color}<extra></extra>'),
+             'hovertext': list(countries), 'legendgroup': '',
+             'marker': {'color': np.asarray(population).tolist(), 'coloraxis': 'coloraxis',
+                        'size': size, 'sizemode': 'area',
+                        'sizeref': size / size_max ** 2, 'symbol': 'circle'},
+             'mode': 'markers', 'name': '', 'orientation': 'h', 'showlegend': False,
+             'x': np.asarray(values).tolist(), 'xaxis': 'x', 'y': list(countries),
+             'yaxis': 'y', 'type': 'scattergl' if render_mode == 'webgl' else 'scatter'}
+    layout = _axes(x_title, 'Country Name')
+    layout['xaxis']['ticksuffix'] = '%'
+    layout.update(template=TEMPLATE,
+                  coloraxis={'colorbar': {'title': {'text': 'Population, total'}},
+                             'colorscale': CIVIDIS},
+                  legend={'tracegroupgap': 0, 'itemsizing': 'constant'},
+                  title={'text': title}, height=height, paper_bgcolor='#E5ECF6')
+    return {'data': [trace], 'layout': layout}
+
+
+def year_histogram(counts, edges, indicator, wrap=4, colors=px.colors.qualitative.Plotly,
+                   col_spacing=0.02, row_spacing=0.07):
+    """Facets of bars, one per year, from bin ``counts`` ({year: array}) over shared ``edges``.
+
+    Laid out like px.histogram(..., facet_col='year', facet_col_wrap=wrap):
+    subplot axes are numbered from the bottom-left cell, facets fill the
+    grid from the top-left.
+    """
+    years = sorted(counts)
+    n_cols = min(len(years), wrap)
+    n_rows = -(-len(years) // wrap)
+    cell_width = (1 - (n_cols - 1) * col_spacing) / n_cols
+    cell_height = (1 - (n_rows - 1) * row_spacing) / n_rows
+    layout = {}
+    for row in range(n_rows):
+        for col in range(n_cols):
+            n = row * n_cols + col + 1
+            suffix = '' if n == 1 else str(n)
+            x0 = col * (cell_width + col_spacing)
+            y0 = row * (cell_height + row_spacing)
+            xaxis = {'anchor': 'y' + suffix, 'domain': [x0, x0 + cell_width],
+                     'title': {'text': ''}}
+            yaxis = {'anchor': 'x' + suffix, 'domain': [y0, y0 + cell_height]}
+            if n > 1:
+                xaxis['matches'] = 'x'
+                yaxis['matches'] = 'y'
+            if row > 0:
+                xaxis['showticklabels'] = False
+            if col == 0:
+                yaxis['title'] = {'text': 'count'}
+            else:
+                yaxis['showticklabels'] = False
+            layout['xaxis' + suffix] = xaxis
+            layout['yaxis' + suffix] = yaxis
+
+    centers = ((edges[:-1] + edges[1:]) / 2).tolist()
+    traces, annotations = [], []
+    for i, year in enumerate(years):
+        n = (n_rows - 1 - i // wrap) * n_cols + i % wrap + 1
+        suffix = '' if n == 1 else str(n)
+        traces.append({'alignmentgroup': 'True',
+                       'hovertemplate': (f'year={year}<br>{indicator}=%{{x:.4g}}'
+                                         '<br>count=%{y}<extra></extra>'),
+                       'legendgroup': str(year), 'marker': {'color': colors[i % len(colors)]},
+                       'name': str(year), 'offsetgroup': str(year), 'orientation': 'v',
+                       'showlegend': True, 'width': float(edges[1] - edges[0]),
+                       'x': centers, 'xaxis': 'x' + suffix,
+                       'y': np.asarray(counts[year]).tolist(), 'yaxis': 'y' + suffix,
+                       'type': 'bar'})
+        xaxis, yaxis = layout['xaxis' + suffix], layout['yaxis' + suffix]
+        annotations.append({'showarrow': False, 'text': f'year={year}',
+                            'x': sum(xaxis['domain']) / 2, 'xanchor': 'center', 'xref': 'paper',
+                            'y': yaxis['domain'][1], 'yanchor': 'bottom', 'yref': 'paper'})
+    annotations.append({'showarrow': False, 'text': indicator, 'x': 0.5, 'xref': 'paper',
+                        'y': -0.12, 'yref': 'paper'})
+    layout.update(template=TEMPLATE, annotations=annotations,
+                  legend={'title': {'text': 'year'}, 'tracegroupgap': 0},
+                  title={'text': indicator + ' Histogram'}, barmode='relative', bargap=0,
+                  height=700, paper_bgcolor='#E5ECF6')
+    return {'data': traces, 'layout': layout}
+
+
+def cluster_sweep_chart(ks, inertia, silhouette, title):
+    """Inertia (left axis) and silhouette score (right axis) against the number of clusters."""
+    ks = np.asarray(ks).tolist()
+    traces = [{'mode': 'lines+markers', 'name': 'Inertia', 'x': ks,
+               'y': np.asarray(inertia).tolist(), 'yaxis': 'y', 'type': 'scatter'},
+              {'mode': 'lines+markers', 'name': 'Silhouette score', 'x': ks,
+               'y': np.asarray(silhouette).tolist(), 'yaxis': 'y2', 'type': 'scatter'}]
+    layout = _axes('Number of clusters', 'Inertia')
+    layout['xaxis']['dtick'] = 1
+    layout.update(yaxis2={'anchor': 'x', 'overlaying': 'y', 'side': 'right',
+                          'title': {'text': 'Silhouette score'}},
+                  template=TEMPLATE, title={'text': title}, height=400,
+                  hovermode='x', paper_bgcolor='#E5ECF6')
+    return {'data': traces, 'layout': layout}
+
+
+def cluster_choropleth(countries, labels, hover_values, indicators, title,
+                       colors=px.colors.qualitative.T10):
+    countries = np.asarray(countries, dtype=object)
+    labels = np.asarray(labels)
+    hover = ''.join(f'<br>{indicator}=%{{customdata[{i}]}}'
+                    for i, indicator in enumerate(indicators))
+    # One trace per cluster, in order of first appearance like px does.
+    _, first = np.unique(labels, return_index=True)
+    traces = []
+    for i, label in enumerate(labels[np.sort(first)]):
+        rows = labels == label
+        color = colors[i % len(colors)]
+        traces.append({
+            'colorscale': [[0.0, color], [1.0, color]],
+            'customdata': np.asarray(hover_values)[rows].tolist(), 'geo': 'geo',
+            'hovertemplate': f'Cluster={label}<br>Country Name=%{{location}}{hover}<extra></extra>',
+            'locationmode': 'country names', 'locations': countries[rows].tolist(),
+            'name': str(label), 'showlegend': True, 'showscale': False,
+            'z': [1] * int(rows.sum()), 'type': 'choropleth'})
+    layout = {
+        'template': TEMPLATE,
+        'geo': {'domain': {'x': [0.0, 1.0], 'y': [0.0, 1.0]}, 'center': {},
+                'showframe': False, 'showcountries': True,
+                'projection': {'type': 'natural earth'},
+                'lataxis': {'range': [-53, 76]}, 'lonaxis': {'range': [-137, 168]},
+                'landcolor': 'white', 'bgcolor': '#E5ECF6',
+                'countrycolor': 'gray', 'coastlinecolor': 'gray'},
+        'legend': {'title': {'text': 'Cluster'}, 'tracegroupgap': 0},
+        'title': {'text': title}, 'height': 650,
+        'annotations': [{'showarrow': False,
+                         'text': 'Indicators:<br>' + '<br>'.join(indicators),
+                         'x': -0.1, 'xref': 'paper', 'y': -0.15, 'yref': 'paper'}],
+        'paper_bgcolor': '#E5ECF6'}
+    return {'data': traces, 'layout': layout}
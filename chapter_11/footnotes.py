@@ -0,0 +1,72 @@
+import textwrap
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_loader import read_csv_cached
+
+
+class FootnoteStore:
+    """Footnotes from PovStatsFootNote.csv, keyed by (country code, series code, year).
+
+    The file is only read the first time a footnote is requested. The
+    ~33k rows share a few hundred distinct descriptions, so each key maps
+    to a small integer code into a tuple of unique descriptions (already
+    wrapped for hover labels) rather than to its own string. The codes sit
+    in a dense int16 country x series x year array (under 1 MB), which
+    makes every lookup a few dict hits and one array index.
+    """
+
+    def __init__(self, filename='PovStatsFootNote.csv', width=60):
+        self.filename = filename
+        self.width = width
+        self._lock = threading.Lock()
+        self._codes = None
+        self._descriptions = None
+
+    def _load(self):
+        df = read_csv_cached(self.filename,
+                             usecols=['CountryCode', 'SeriesCode', 'Year', 'DESCRIPTION'],
+                             dtype={'DESCRIPTION': 'category'})
+        self._descriptions = tuple('<br>'.join(textwrap.wrap(text, self.width))
+                                   for text in df['DESCRIPTION'].cat.categories)
+        country_idx, countries = pd.factorize(df['CountryCode'])
+        series_idx, series = pd.factorize(df['SeriesCode'])
+        years = df['Year'].str[2:].astype(int).to_numpy()
+        self._first_year = years.min()
+        self._countries = {code: i for i, code in enumerate(countries)}
+        self._series = {code: i for i, code in enumerate(series)}
+        codes = np.full((len(countries), len(series), years.max() - self._first_year + 1),
+                        -1, dtype=np.int16)
+        codes[country_idx, series_idx, years - self._first_year] = df['DESCRIPTION'].cat.codes
+        self._codes = codes
+
+    def _ensure_loaded(self):
+        if self._codes is None:
+            with self._lock:
+                if self._codes is None:
+                    self._load()
+
+    def get(self, country_code, series_code, year, default=''):
+        return self.lookup([country_code], series_code, [year], default)[0]
+
+    def lookup(self, country_codes, series_code, years, default=''):
+        """Footnotes for parallel sequences of country codes and years."""
+        self._ensure_loaded()
+        series_idx = self._series.get(series_code)
+        if series_idx is None:
+            return [default] * len(country_codes)
+        n_years = self._codes.shape[2]
+        notes = []
+        for country, year in zip(country_codes, years):
+            country_idx = self._countries.get(country)
+            year_idx = int(year) - self._first_year
+            code = -1
+            if country_idx is not None and 0 <= year_idx < n_years:
+                code = self._codes[country_idx, series_idx, year_idx]
+            notes.append(default if code < 0 else self._descriptions[code])
+        return notes
+
+
+footnotes = FootnoteStore()
@@ -0,0 +1,24 @@
+# gunicorn -c gunicorn.conf.py app_v11_1:server
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# The app sizes its native thread pools by the number of workers.
+os.environ['WEB_CONCURRENCY'] = str(workers)
+
+# Import the app (and load the data) once in the master, then fork.
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # Move everything the master allocated into the permanent generation so
+    # the workers' garbage collector never writes to those pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Threads do not survive fork, so each worker polls the data files itself.
+    from app_v11_1 import store
+    store.start_watcher()
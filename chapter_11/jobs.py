@@ -0,0 +1,189 @@
+"""Slow computations run in child processes, outside the request threads.
+
+JobQueue.submit() puts a job on a bounded queue and returns its id at
+once; ``max_workers`` threads take jobs off the queue and run each one in
+its own child process, which is terminated if it takes longer than
+``timeout`` seconds. Results go into a ResultStore, and each job's state
+into a small JSON file, both on disk, so any gunicorn worker can answer
+status() for a job that another one submitted. Job ids are derived from
+the data version and the key, so submitting the same work twice, from
+any worker, returns the same job. With ``threads`` set, a job runs under
+that threadpoolctl limit on its native (OpenMP/BLAS) thread pools, and
+the pools it saw are recorded in its status as ``thread_pools``.
+
+    POVERTY_JOB_WORKERS=2  POVERTY_JOB_QUEUE=16  POVERTY_JOB_TIMEOUT=60
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+
+from threadpoolctl import threadpool_info, threadpool_limits
+
+from data_loader import CACHE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get('POVERTY_JOB_WORKERS', 2))
+JOB_QUEUE = int(os.environ.get('POVERTY_JOB_QUEUE', 16))
+JOB_TIMEOUT = float(os.environ.get('POVERTY_JOB_TIMEOUT', 60))
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _run(conn, fn, args, threads):
+    # A child forked from a gunicorn worker inherits its graceful SIGTERM
+    # handler, which would let the job run on after terminate().
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try:
+        with threadpool_limits(limits=threads):
+            thread_pools = threadpool_info()
+            result = fn(*args)
+        conn.send((DONE, result, thread_pools))
+    except Exception as e:
+        conn.send((FAILED, repr(e), None))
+    finally:
+        conn.close()
+
+
+class JobQueue:
+
+    def __init__(self, results, max_workers=JOB_WORKERS, max_pending=JOB_QUEUE,
+                 timeout=JOB_TIMEOUT, threads=None, cache_dir=CACHE_DIR):
+        self.results = results
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.threads = threads
+        self.last_thread_pools = None
+        self.directory = os.path.join(cache_dir, 'jobs', results.name)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._workers_pid = None
+
+    def job_id(self, data, key):
+        return hashlib.sha1(json.dumps([self.results.format_version, data.version, key])
+                            .encode()).hexdigest()[:16]
+
+    def _status_path(self, job_id):
+        return os.path.join(self.directory, job_id + '.json')
+
+    def _write_status(self, job_id, state, **fields):
+        path = self._status_path(job_id)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(fields, state=state, updated=time.time()), f)
+        os.replace(tmp_path, path)
+
+    def status(self, job_id):
+        """{'state': queued|running|done|failed, ...}, or None for an unknown job."""
+        try:
+            with open(self._status_path(job_id)) as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if status['state'] in (QUEUED, RUNNING) and time.time() > status['deadline']:
+            # The process that owned the job went away without finishing it.
+            return dict(status, state=FAILED, error='lost')
+        return status
+
+    def submit(self, data, key, fn, *args):
+        """Queue ``fn(*args)`` as the job computing ``key``; returns the job id.
+
+        Raises QueueFull when ``max_pending`` jobs are already waiting.
+        """
+        job_id = self.job_id(data, key)
+        state = (self.status(job_id) or {}).get('state')
+        if state in (QUEUED, RUNNING):
+            return job_id
+        if state == DONE and self.results.load(data, key) is not None:
+            return job_id
+        self._start_workers()
+        with self._lock:
+            waiting = self._queue.qsize() // self.max_workers + 1
+            deadline = time.time() + self.timeout * (waiting + 1)
+            try:
+                self._queue.put_nowait((job_id, data, key, fn, args))
+            except queue.Full:
+                raise QueueFull(f'{self._queue.maxsize} jobs are already waiting')
+            self._write_status(job_id, QUEUED, version=data.version, deadline=deadline)
+        return job_id
+
+    def _start_workers(self):
+        # Threads do not survive a fork, so each gunicorn worker starts its own.
+        with self._lock:
+            if self._workers_pid == os.getpid():
+                return
+            self._workers_pid = os.getpid()
+            for i in range(self.max_workers):
+                threading.Thread(target=self._work, name=f'jobs-{self.results.name}-{i}',
+                                 daemon=True).start()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run_job(*job)
+            except Exception:
+                logger.exception('Job %s failed', job[0])
+                self._write_status(job[0], FAILED, version=job[1].version, error='internal error')
+
+    def _run_job(self, job_id, data, key, fn, args):
+        started = time.time()
+        self._write_status(job_id, RUNNING, version=data.version, started=started,
+                           deadline=started + self.timeout + 5)
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_run, args=(sender, fn, args, self.threads),
+                                          daemon=True)
+        process.start()
+        sender.close()
+        if receiver.poll(self.timeout):
+            try:
+                state, result, thread_pools = receiver.recv()
+            except EOFError:
+                process.join()
+                state, result = FAILED, f'job process exited with code {process.exitcode}'
+        else:
+            state, result = FAILED, f'timed out after {self.timeout:g}s'
+            process.terminate()
+            process.join(5)
+            if process.is_alive():
+                process.kill()
+        process.join()
+        receiver.close()
+        if state == DONE:
+            self.results.save(data, key, result)
+            self.last_thread_pools = thread_pools
+            self._write_status(job_id, DONE, version=data.version, started=started,
+                               finished=time.time(), thread_pools=thread_pools)
+        else:
+            self._write_status(job_id, FAILED, version=data.version, started=started,
+                               error=result)
+
+    def drop_versions_except(self, version):
+        """Delete the status files of jobs on other data versions."""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path) as f:
+                    if json.load(f).get('version') == version:
+                        continue
+                os.remove(path)
+            except (OSError, ValueError):
+                pass
@@ -0,0 +1,78 @@
+"""Computed results (NumPy arrays and scalars), kept per data version.
+
+Like FigureStore, but for the output of a computation rather than a
+rendered figure: a dict of arrays and numbers, handed to save() by
+whatever computed it (a JobQueue, for one). It is kept in an in-memory LRU
+of ``maxsize`` entries and in an .npz file under
+CACHE_DIR/results/<name>/<format version>/<data version>/. The disk tier
+survives restarts and is shared by all processes on the host, so a result
+computed by one gunicorn worker is a file read for the others. Pass a
+``format_version`` that changes with the code (and libraries) computing
+the results, so that a deploy never serves results of the old code.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from data_loader import CACHE_DIR, remove_versions_except
+
+
+class ResultStore:
+
+    def __init__(self, name, format_version='', cache_dir=CACHE_DIR, maxsize=128):
+        self.name = name
+        self.format_version = format_version
+        self.directory = os.path.join(cache_dir, 'results', name, format_version)
+        self.maxsize = maxsize
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, version, key):
+        digest = hashlib.sha1(json.dumps(key).encode()).hexdigest()[:16]
+        return os.path.join(self.directory, version, digest + '.npz')
+
+    def _remember(self, cache_key, result):
+        with self._lock:
+            self._results[cache_key] = result
+            self._results.move_to_end(cache_key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def load(self, data, key):
+        """The stored result for ``key``, or None if it was never computed."""
+        cache_key = (data.version, json.dumps(key))
+        with self._lock:
+            result = self._results.get(cache_key)
+            if result is not None:
+                self._results.move_to_end(cache_key)
+                return result
+        try:
+            with np.load(self.path(data.version, key)) as npz:
+                result = {name: npz[name] for name in npz.files}
+        except (OSError, ValueError):
+            return None
+        self._remember(cache_key, result)
+        return result
+
+    def save(self, data, key, result):
+        result = {name: np.asarray(value) for name, value in result.items()}
+        path = self.path(data.version, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **result)
+        os.replace(tmp_path, path)
+        self._remember((data.version, json.dumps(key)), result)
+        return result
+
+    def drop_versions_except(self, version):
+        """Forget the results of other data versions, in memory and on disk."""
+        with self._lock:
+            for cache_key in list(self._results):
+                if cache_key[0] != version:
+                    self._results.pop(cache_key, None)
+        remove_versions_except(self.directory, version)
@@ -0,0 +1,95 @@
+"""Filtering, sorting and paging DataTables on the server.
+
+A DataTable with ``page_action``, ``sort_action`` and ``filter_action`` set
+to 'custom' only sends its ``filter_query``, ``sort_by`` and
+``page_current`` to a callback, which returns the rows of that one page.
+filter_frame() and sort_frame() apply them to a frame with the same
+semantics as the native table for the operators the filter row produces;
+callbacks cache the result so that paging through it is only a slice.
+"""
+import math
+
+import pandas as pd
+
+from data_loader import float64_values
+
+
+# Filter row operator -> pandas comparison. split_filter_part() tries the
+# longest ones first, so '<=' is not read as '<' followed by '= value'.
+OPERATORS = {'>=': 'ge', '<=': 'le', '!=': 'ne', '>': 'gt', '<': 'lt', '=': 'eq',
+             'ge': 'ge', 'le': 'le', 'ne': 'ne', 'gt': 'gt', 'lt': 'lt', 'eq': 'eq',
+             'contains': 'contains', 'datestartswith': 'datestartswith',
+             'is blank': 'is blank', 'is nil': 'is blank'}
+STRING_OPERATORS = ('contains', 'datestartswith')
+
+
+def split_filter_part(part):
+    """('column', 'operator', value) for one clause like ``{year} > 2010``."""
+    start, end = part.find('{'), part.rfind('}')
+    if start < 0 or end < start:
+        return None
+    name = part[start + 1:end]
+    rest = part[end + 1:].strip()
+    for token in sorted(OPERATORS, key=len, reverse=True):
+        if rest.startswith(token):
+            value = rest[len(token):].strip()
+            break
+    else:
+        return None
+    if value[:1] in ('"', "'", '`') and value[-1:] == value[:1]:
+        value = value[1:-1].replace('\\' + value[0], value[0])
+    elif value and OPERATORS[token] not in STRING_OPERATORS:
+        try:
+            value = float(value)
+        except ValueError:
+            pass
+    return name, OPERATORS[token], value
+
+
+def filter_frame(df, filter_query):
+    for part in (filter_query or '').split(' && '):
+        clause = split_filter_part(part)
+        if clause is None or clause[0] not in df.columns:
+            continue
+        name, operator, value = clause
+        col = df[name]
+        if operator == 'is blank':
+            mask = col.isna()
+        elif operator in STRING_OPERATORS:
+            text = col.astype(str)
+            mask = (text.str.contains(str(value), regex=False) if operator == 'contains'
+                    else text.str.startswith(str(value)))
+        else:
+            if not pd.api.types.is_numeric_dtype(col):
+                col = col.astype(str)
+                value = str(value) if not isinstance(value, float) else f'{value:g}'
+            try:
+                mask = getattr(col, operator)(value)
+            except TypeError:
+                # e.g. {year} > abc: a number is never less or greater than text.
+                mask = pd.Series(False, index=col.index)
+        df = df[mask.to_numpy()]
+    return df
+
+
+def sort_key(sort_by):
+    """Hashable form of a DataTable ``sort_by``, for caching sorted frames."""
+    return tuple((col['column_id'], col['direction']) for col in sort_by or [])
+
+
+def sort_frame(df, key):
+    key = [(name, direction) for name, direction in key if name in df.columns]
+    if not key:
+        return df
+    return df.sort_values([name for name, _ in key],
+                          ascending=[direction == 'asc' for _, direction in key],
+                          kind='mergesort', na_position='last')
+
+
+def page_records(df, page_current, page_size):
+    """Records of page ``page_current`` and the number of pages."""
+    start = (page_current or 0) * page_size
+    page = df.iloc[start:start + page_size]
+    page = page.assign(**{col: float64_values(page[col])
+                          for col in page.columns[page.dtypes.eq('float32')]})
+    return page.to_dict('records'), max(math.ceil(len(df) / page_size), 1)
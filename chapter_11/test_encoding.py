@@ -0,0 +1,28 @@
+"""encode_array() against decoding its output with NumPy."""
+import base64
+
+import numpy as np
+
+from encoding import encode_array
+
+
+def decoded(encoded):
+    return np.frombuffer(base64.b64decode(encoded['bdata']), dtype='<' + encoded['dtype'])
+
+
+def test_whole_floats_use_narrow_ints():
+    encoded = encode_array([1.0, -2.0, 300.0])
+    assert encoded['dtype'] == 'i2'
+    assert decoded(encoded).tolist() == [1, -2, 300]
+
+
+def test_large_whole_floats_stay_floats():
+    for values in ([1e19] * 3, [1.5e20, 2.0], [2.0 ** 31, 0.0], [-2.0 ** 63, 1.0]):
+        encoded = encode_array(values)
+        assert encoded['dtype'] == 'f8'
+        assert decoded(encoded).tolist() == values
+
+
+def test_empty_and_gaps():
+    assert decoded(encode_array([])).tolist() == []
+    assert np.isnan(decoded(encode_array([1.0, None]))).tolist() == [False, True]
@@ -0,0 +1,144 @@
+"""The dict builders in figures.py against the plotly.express code they replaced.
+
+Run from this directory with ``python -m pytest test_figures.py``.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.utils
+
+from figures import (cluster_choropleth, gini_country_bars, gini_year_bar, perc_pov_scatter,
+                     year_histogram)
+
+
+GINI = 'GINI index (World Bank estimate)'
+POVERTY_GAP = 'Poverty gap at $1.90 a day (2011 PPP) (%)'
+COUNTRIES = ['Albania', 'Brazil', 'Chad', 'Denmark', 'Ecuador', 'France', 'Ghana']
+
+
+def plain(fig):
+    """A figure (or figure dict) as JSON data, without the template."""
+    if not isinstance(fig, dict):
+        fig = fig.to_plotly_json()
+    fig = json.loads(json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder))
+    fig['layout'].pop('template', None)
+    for annotation in fig['layout'].get('annotations', []):
+        if not annotation.get('font'):
+            annotation.pop('font', None)
+    return fig
+
+
+def rounded(obj, digits=9):
+    """``obj`` with floats rounded, for layouts whose domains px sums up step by step."""
+    if isinstance(obj, float):
+        return round(obj, digits)
+    if isinstance(obj, dict):
+        return {key: rounded(value, digits) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [rounded(value, digits) for value in obj]
+    return obj
+
+
+def frame(years=(2015, 2016), seed=0):
+    rng = np.random.default_rng(seed)
+    rows = [(country, year) for country in COUNTRIES for year in years]
+    df = pd.DataFrame(rows, columns=['Country Name', 'year'])
+    df[GINI] = rng.uniform(25, 60, len(df)).round(1)
+    df[POVERTY_GAP] = rng.uniform(0, 40, len(df)).round(2)
+    df['Population, total'] = rng.integers(10 ** 5, 10 ** 8, len(df)).astype(float)
+    return df
+
+
+def test_gini_year_bar():
+    df = frame().query('year == 2016').sort_values(GINI)
+    old = px.bar(df, x=GINI, y='Country Name', orientation='h',
+                 height=200 + len(df) * 20, title=GINI + ' 2016')
+    old.layout.paper_bgcolor = '#E5ECF6'
+    new = gini_year_bar(df[GINI].to_numpy(), df['Country Name'].tolist(), GINI,
+                        title=GINI + ' 2016', height=200 + len(df) * 20)
+    assert plain(new) == plain(old)
+
+
+def test_gini_country_bars():
+    df = frame(years=range(2010, 2016))
+    countries = ['Chad', 'Albania', 'France']
+    selected = df[df['Country Name'].isin(countries)]
+    old = px.bar(selected, x='year', y=GINI, height=100 + 250 * len(countries),
+                 facet_row='Country Name', color='Country Name',
+                 labels={GINI: 'Gini Index'}, title='Gini')
+    old.layout.paper_bgcolor = '#E5ECF6'
+    series = [(country, rows['year'].to_numpy(), rows[GINI].to_numpy())
+              for country, rows in selected.groupby('Country Name', sort=False)]
+    new = gini_country_bars(series, 'Gini Index', title='Gini',
+                            height=100 + 250 * len(countries))
+    assert plain(new) == plain(old)
+
+
+def test_perc_pov_scatter():
+    df = frame().query('year == 2015').sort_values(POVERTY_GAP)
+    old = px.scatter(df, x=POVERTY_GAP, y='Country Name', color='Population, total',
+                     size=[30] * len(df), size_max=15, hover_name='Country Name',
+                     height=250 + 20 * len(df), color_continuous_scale='cividis',
+                     title='Poverty gap')
+    old.layout.paper_bgcolor = '#E5ECF6'
+    old.layout.xaxis.ticksuffix = '%'
+    expected = plain(old)
+    # The one difference on purpose: a single marker size instead of a list.
+    trace = expected['data'][0]
+    trace['marker']['size'] = 30
+    trace['hovertemplate'] = trace['hovertemplate'].replace('%{marker.size}', '30')
+    new = perc_pov_scatter(df[POVERTY_GAP].to_numpy(), df['Country Name'].tolist(),
+                           df['Population, total'].to_numpy(), POVERTY_GAP,
+                           title='Poverty gap', height=250 + 20 * len(df))
+    assert plain(new) == expected
+
+
+def test_cluster_choropleth():
+    df = frame().query('year == 2015')
+    indicators = [GINI, POVERTY_GAP]
+    labels = np.array([2, 0, 2, 1, 0, 1, 2])
+    old = px.choropleth(df, locations='Country Name', locationmode='country names',
+                        color=[str(x) for x in labels], labels={'color': 'Cluster'},
+                        hover_data=indicators, height=650, title='Clusters',
+                        color_discrete_sequence=px.colors.qualitative.T10)
+    old.add_annotation(x=-0.1, y=-0.15, xref='paper', yref='paper',
+                       text='Indicators:<br>' + '<br>'.join(indicators), showarrow=False)
+    old.layout.geo.showframe = False
+    old.layout.geo.showcountries = True
+    old.layout.geo.projection.type = 'natural earth'
+    old.layout.geo.lataxis.range = [-53, 76]
+    old.layout.geo.lonaxis.range = [-137, 168]
+    old.layout.geo.landcolor = 'white'
+    old.layout.geo.bgcolor = '#E5ECF6'
+    old.layout.paper_bgcolor = '#E5ECF6'
+    old.layout.geo.countrycolor = 'gray'
+    old.layout.geo.coastlinecolor = 'gray'
+    new = cluster_choropleth(df['Country Name'].tolist(), labels, df[indicators].to_numpy(),
+                             indicators, title='Clusters')
+    assert plain(new) == plain(old)
+
+
+def test_year_histogram_layout():
+    # The bars are binned on the server, so only the facet layout is px's.
+    years = range(2010, 2016)
+    df = frame(years=years)
+    edges = np.histogram_bin_edges(df[GINI], bins=10)
+    counts = {year: np.histogram(df[df['year'] == year][GINI], bins=edges)[0]
+              for year in years}
+    old = px.histogram(df, x=GINI, facet_col='year', color='year',
+                       title=GINI + ' Histogram', facet_col_wrap=4, height=700)
+    old.for_each_xaxis(lambda axis: axis.update(title=''))
+    old.add_annotation(text=GINI, x=0.5, y=-0.12, xref='paper', yref='paper', showarrow=False)
+    old.layout.paper_bgcolor = '#E5ECF6'
+    old = rounded(plain(old)['layout'])
+    new = rounded(plain(year_histogram(counts, edges, GINI))['layout'])
+    for name in old:
+        if name.startswith(('xaxis', 'yaxis')):
+            assert new[name] == old[name], name
+    # Facet labels in any order.
+    assert (sorted(new['annotations'], key=json.dumps) ==
+            sorted(old['annotations'], key=json.dumps))
+    for key in ('legend', 'title', 'height', 'paper_bgcolor'):
+        assert new[key] == old[key], key